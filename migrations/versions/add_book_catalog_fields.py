@@ -0,0 +1,35 @@
+"""add book catalog fields (description, categories, page_count, language, published_date, fetched_at)
+
+Revision ID: add_book_catalog_fields
+Revises: add_user_profile_prefs
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_book_catalog_fields"
+down_revision = "add_user_profile_prefs"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("book", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("description", sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column("categories", sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column("page_count", sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column("language", sa.String(length=10), nullable=True))
+        batch_op.add_column(sa.Column("published_date", sa.String(length=20), nullable=True))
+        batch_op.add_column(sa.Column("fetched_at", sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table("book", schema=None) as batch_op:
+        batch_op.drop_column("fetched_at")
+        batch_op.drop_column("published_date")
+        batch_op.drop_column("language")
+        batch_op.drop_column("page_count")
+        batch_op.drop_column("categories")
+        batch_op.drop_column("description")
@@ -0,0 +1,41 @@
+"""add chat_channel table
+
+Revision ID: add_chat_channel
+Revises: add_stream_user_sync
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_chat_channel"
+down_revision = "add_stream_user_sync"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "chat_channel",
+        sa.Column("id", sa.String(length=128), nullable=False),
+        sa.Column("isbn", sa.String(length=20), nullable=True),
+        sa.Column("name", sa.String(length=255), nullable=True),
+        sa.Column("book_title", sa.String(length=255), nullable=True),
+        sa.Column("member_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("created_by_id", sa.String(length=64), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("last_message_at", sa.DateTime(), nullable=True),
+        sa.Column("last_activity_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_chat_channel_isbn", "chat_channel", ["isbn"])
+    op.create_index("ix_chat_channel_activity", "chat_channel", ["last_activity_at", "id"])
+    op.create_index("ix_chat_channel_members", "chat_channel", ["member_count", "last_activity_at", "id"])
+
+
+def downgrade():
+    op.drop_index("ix_chat_channel_members", table_name="chat_channel")
+    op.drop_index("ix_chat_channel_activity", table_name="chat_channel")
+    op.drop_index("ix_chat_channel_isbn", table_name="chat_channel")
+    op.drop_table("chat_channel")
@@ -0,0 +1,58 @@
+"""add geohash column and index to event
+
+Revision ID: add_event_geohash
+Revises: add_event_indexes
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_event_geohash"
+down_revision = "add_event_indexes"
+branch_labels = None
+depends_on = None
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def _encode_geohash(lat, lng, precision=9):
+    # Copia mínima de api.utils_scripts.geo.encode_geohash para no depender del código de la app
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bit, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, coord = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if coord >= mid:
+            value, rng[0] = (value << 1) | 1, mid
+        else:
+            value, rng[1] = value << 1, mid
+        even, bit = not even, bit + 1
+        if bit == 5:
+            chars.append(_BASE32[value])
+            bit, value = 0, 0
+    return "".join(chars)
+
+
+def upgrade():
+    with op.batch_alter_table("event", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("geohash", sa.String(length=12), nullable=True))
+        batch_op.create_index("ix_event_geohash", ["geohash"])
+
+    conn = op.get_bind()
+    rows = conn.execute(sa.text(
+        "SELECT id, lat, lng FROM event WHERE lat IS NOT NULL AND lng IS NOT NULL"
+    )).fetchall()
+    for event_id, lat, lng in rows:
+        if -90 <= lat <= 90 and -180 <= lng <= 180:
+            conn.execute(
+                sa.text("UPDATE event SET geohash = :g WHERE id = :id"),
+                {"g": _encode_geohash(lat, lng), "id": event_id},
+            )
+
+
+def downgrade():
+    with op.batch_alter_table("event", schema=None) as batch_op:
+        batch_op.drop_index("ix_event_geohash")
+        batch_op.drop_column("geohash")
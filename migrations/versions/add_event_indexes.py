@@ -0,0 +1,24 @@
+"""add indexes on event (date, time) and (category, date)
+
+Revision ID: add_event_indexes
+Revises: add_book_catalog_fields
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+
+
+revision = "add_event_indexes"
+down_revision = "add_book_catalog_fields"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_event_date_time", "event", ["date", "time"])
+    op.create_index("ix_event_category_date", "event", ["category", "date"])
+
+
+def downgrade():
+    op.drop_index("ix_event_category_date", table_name="event")
+    op.drop_index("ix_event_date_time", table_name="event")
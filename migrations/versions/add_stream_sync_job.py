@@ -0,0 +1,35 @@
+"""add stream_sync_job table
+
+Revision ID: add_stream_sync_job
+Revises: add_event_geohash
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_stream_sync_job"
+down_revision = "add_event_geohash"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "stream_sync_job",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("restore", sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("run_after", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+    op.create_index("ix_stream_sync_job_run_after", "stream_sync_job", ["run_after"])
+
+
+def downgrade():
+    op.drop_index("ix_stream_sync_job_run_after", table_name="stream_sync_job")
+    op.drop_table("stream_sync_job")
@@ -0,0 +1,31 @@
+"""add stream_user_sync table
+
+Revision ID: add_stream_user_sync
+Revises: add_stream_sync_job
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_stream_user_sync"
+down_revision = "add_stream_sync_job"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "stream_user_sync",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(length=50), nullable=True),
+        sa.Column("image", sa.String(length=500), nullable=True),
+        sa.Column("synced_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+
+
+def downgrade():
+    op.drop_table("stream_user_sync")
@@ -0,0 +1,28 @@
+"""add user_library.added_at and an index for listing a library by date added
+
+Revision ID: add_user_library_added_at
+Revises: add_user_username_prefix_index
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_user_library_added_at"
+down_revision = "add_user_username_prefix_index"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Las filas existentes no tienen fecha real: se quedan con la de la migración
+    with op.batch_alter_table("user_library", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("added_at", sa.DateTime(), nullable=False, server_default=sa.func.now()))
+    op.create_index("ix_user_library_user_added", "user_library", ["user_id", "added_at", "book_isbn"])
+
+
+def downgrade():
+    op.drop_index("ix_user_library_user_added", table_name="user_library")
+    with op.batch_alter_table("user_library", schema=None) as batch_op:
+        batch_op.drop_column("added_at")
@@ -0,0 +1,26 @@
+"""add a pattern-ops index on lower(username) for prefix search in /users
+
+Revision ID: add_user_username_prefix_index
+Revises: normalize_user_email_username
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+
+
+revision = "add_user_username_prefix_index"
+down_revision = "normalize_user_email_username"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Con una collation distinta de "C", Postgres solo usa un índice para LIKE 'abc%' si es
+    # varchar_pattern_ops. En SQLite no hace falta (ni existe).
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute('CREATE INDEX ix_user_username_prefix ON "user" (lower(username) varchar_pattern_ops)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == "postgresql":
+        op.drop_index("ix_user_username_prefix", table_name="user")
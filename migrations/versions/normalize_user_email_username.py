@@ -0,0 +1,38 @@
+"""lowercase user emails and add a unique index on lower(username)
+
+Revision ID: normalize_user_email_username
+Revises: add_chat_channel
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "normalize_user_email_username"
+down_revision = "add_chat_channel"
+branch_labels = None
+depends_on = None
+
+
+def _duplicates(conn, expression):
+    return conn.execute(sa.text(
+        f'SELECT {expression} AS value, COUNT(*) FROM "user" GROUP BY {expression} HAVING COUNT(*) > 1'
+    )).fetchall()
+
+
+def upgrade():
+    conn = op.get_bind()
+    # Si ya hay cuentas que solo se diferencian en mayúsculas hay que resolverlas a mano antes
+    for column, expression in (("email", "lower(trim(email))"), ("username", "lower(username)")):
+        duplicates = _duplicates(conn, expression)
+        if duplicates:
+            values = ", ".join(str(row[0]) for row in duplicates[:20])
+            raise RuntimeError(f"Users with {column} differing only in case/spaces: {values}")
+
+    op.execute('UPDATE "user" SET email = lower(trim(email)) WHERE email <> lower(trim(email))')
+    op.create_index("ix_user_username_lower", "user", [sa.text("lower(username)")], unique=True)
+
+
+def downgrade():
+    op.drop_index("ix_user_username_lower", table_name="user")
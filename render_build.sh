@@ -65,3 +65,6 @@ else
   echo "Aplicando migraciones existentes (upgrade)..."
   pipenv run upgrade
 fi
+
+# Directorio local de canales de chat: rellenarlo desde Stream si aún está vacío
+pipenv run python -m flask sync-chat-channels --if-empty
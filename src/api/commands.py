@@ -1,7 +1,11 @@
 
 from itertools import count
 import click
-from api.models import db, User
+from api.models import db, User, ChatChannel
+from api.utils_scripts.stream_sync import run_worker
+from api.utils_scripts.stream_client import get_stream_client
+from api.utils_scripts.chat_channels import sync_from_stream
+from api.utils_scripts.password_hashing import benchmark
 
 """
 In this file, you can add as many commands as you want using the @app.cli.command decorator
@@ -31,4 +35,52 @@ def setup_commands(app):
     
     @app.cli.command("insert-test-data")
     def insert_test_data():
-        pass
\ No newline at end of file
+        pass
+
+    """
+    Worker de la cola de sincronización con Stream Chat (ver api/utils_scripts/stream_sync.py).
+    Úsalo con STREAM_SYNC_WORKER=external en los procesos web: $ flask stream-sync-worker
+    """
+    @app.cli.command("stream-sync-worker")
+    @click.option("--poll-interval", default=5.0, help="Segundos entre comprobaciones de la cola")
+    def stream_sync_worker(poll_interval):
+        print("Stream sync worker started")
+        run_worker(app, poll_interval=poll_interval)
+
+    """
+    Rellena la tabla chat_channel con los canales de libro que ya existen en Stream.
+    Solo hace falta una vez (después la mantienen las rutas y el webhook): $ flask sync-chat-channels
+    Con --if-empty solo sincroniza si la tabla está vacía y un fallo de Stream no hace
+    fallar el comando; así se ejecuta en cada despliegue (Procfile release y render_build.sh).
+    """
+    @app.cli.command("sync-chat-channels")
+    @click.option("--if-empty", is_flag=True, help="Solo si chat_channel está vacía; no falla si Stream no responde")
+    def sync_chat_channels(if_empty):
+        if if_empty and db.session.query(ChatChannel.query.exists()).scalar():
+            print("chat_channel already filled, skipping sync")
+            return
+        try:
+            total = sync_from_stream(get_stream_client())
+        except Exception as e:
+            if not if_empty:
+                raise
+            print(f"Chat channel sync skipped: {e}")
+            return
+        print(f"{total} book channels synced")
+
+    """
+    Logins por segundo y núcleo con cada método de hash, para elegir PASSWORD_HASH_METHOD:
+    $ flask bench-password-hashing --methods "pbkdf2:sha256:600000,scrypt:32768:8:1,argon2"
+    """
+    @app.cli.command("bench-password-hashing")
+    @click.option("--methods", default="pbkdf2:sha256:600000,pbkdf2:sha256:260000,scrypt:32768:8:1,scrypt:16384:8:1,argon2",
+                  help="Métodos separados por comas (de werkzeug o argon2)")
+    @click.option("--seconds", default=2.0, help="Segundos de medición por método")
+    def bench_password_hashing(methods, seconds):
+        for method in [m.strip() for m in methods.split(",") if m.strip()]:
+            try:
+                result = benchmark(method, seconds=seconds)
+            except RuntimeError as e:
+                print(f"{method:<40} skipped: {e}")
+                continue
+            print(f"{result['method']:<40} {result['logins_per_sec_per_core']:>10} logins/s/core  {result['ms_per_login']:>8} ms/login")
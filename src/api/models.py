@@ -1,8 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import String, Boolean, Float, Text
 from sqlalchemy.orm import Mapped, mapped_column
-from werkzeug.security import generate_password_hash, check_password_hash
+from api.utils_scripts.password_hashing import hash_password, verify_password, needs_rehash, record_rehash
 from sqlalchemy import String, Date, Time
+from datetime import datetime
 
 db = SQLAlchemy()
 
@@ -16,6 +17,9 @@ user_library = db.Table(
     "user_library",
     db.Column("user_id", db.Integer, db.ForeignKey("user.id"), primary_key=True),
     db.Column("book_isbn", db.String(20), db.ForeignKey("book.isbn"), primary_key=True),
+    db.Column("added_at", db.DateTime, nullable=False, default=datetime.utcnow, server_default=db.func.now()),
+    # Librería de un usuario por fecha de alta sin ordenar en memoria (GET /library/<id>/books)
+    db.Index("ix_user_library_user_added", "user_id", "added_at", "book_isbn"),
 )
 
 
@@ -26,6 +30,62 @@ class UserTop3(db.Model):
     position = db.Column(db.Integer, primary_key=True)  # 1, 2, 3
     book_isbn = db.Column(db.String(20), db.ForeignKey("book.isbn"), nullable=True)
 
+class StreamSyncJob(db.Model):
+    """
+    Sincronización pendiente de un usuario con Stream Chat (upsert de nombre/avatar).
+    Una fila por usuario: encolar otra vez el mismo usuario solo actualiza la existente.
+    """
+    __tablename__ = "stream_sync_job"
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    restore = db.Column(db.Boolean, nullable=False, default=False)  # restaurar antes (usuario borrado en Stream)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+
+class StreamUserSync(db.Model):
+    """Último nombre/avatar enviado a Stream por usuario, para no repetir upserts que no cambian nada."""
+    __tablename__ = "stream_user_sync"
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    name = db.Column(db.String(50), nullable=True)
+    image = db.Column(db.String(500), nullable=True)
+    synced_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class ChatChannel(db.Model):
+    """
+    Directorio local de los canales de libro de Stream ("book-..."), para listar
+    /chat/public-channels sin consultar Stream. Lo mantienen las rutas create-or-join
+    y el webhook de Stream.
+    """
+    __tablename__ = "chat_channel"
+    id = db.Column(db.String(128), primary_key=True)  # id del canal en Stream (tipo messaging)
+    isbn = db.Column(db.String(20), nullable=True, index=True)
+    name = db.Column(db.String(255), nullable=True)
+    book_title = db.Column(db.String(255), nullable=True)
+    member_count = db.Column(db.Integer, nullable=False, default=0)
+    created_by_id = db.Column(db.String(64), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_message_at = db.Column(db.DateTime, nullable=True)
+    # último mensaje o, si no hay, creación; nunca NULL para poder paginar por cursor
+    last_activity_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_chat_channel_activity", "last_activity_at", "id"),
+        db.Index("ix_chat_channel_members", "member_count", "last_activity_at", "id"),
+    )
+
+    def serialize(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "book_title": self.book_title,
+            "isbn": self.isbn,
+            "member_count": self.member_count,
+            "created_at": self.created_at.isoformat() + "Z" if self.created_at else None,
+            "last_message_at": self.last_message_at.isoformat() + "Z" if self.last_message_at else None,
+            "created_by_id": self.created_by_id,
+        }
+
 #---- USER MODEL ----#
 class User(db.Model):
     __tablename__ = "user"
@@ -67,6 +127,7 @@ class User(db.Model):
     library_books = db.relationship(
         "Book",
         secondary=user_library,
+        order_by=user_library.c.added_at,
         lazy= "select",
         backref=db.backref("owners", lazy="select")
     )
@@ -76,22 +137,38 @@ class User(db.Model):
 
 
     def set_password(self, password):
-        self.password = generate_password_hash(password)
+        self.password = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password, password)
+        return verify_password(self.password, password)
+
+    def upgrade_password_hash(self, password):
+        """Tras un login correcto: rehace el hash si se guardó con otro método o parámetros. No hace commit."""
+        if not needs_rehash(self.password):
+            return False
+        self.password = hash_password(password)
+        record_rehash()
+        return True
 
     DEFAULT_AVATAR_URL = "https://res.cloudinary.com/dcmqxfpnd/image/upload/v1770140317/i9acwjupwp34xsegrzm6.jpg"
 
+    # Campos públicos de serialize() (nunca password ni about_text)
+    PUBLIC_FIELDS = ("id", "email", "username", "is_active", "image_avatar", "current_reading_isbn")
+
     def serialize(self):
-        return {
-            "id": str(self.id),
-            "email": self.email,
-            "username": self.username,
-            "is_active": self.is_active,
-            "image_avatar": self.image_avatar or self.DEFAULT_AVATAR_URL,
-            "current_reading_isbn": self.current_reading_isbn,
+        return self.serialize_fields(self.PUBLIC_FIELDS)
+
+    def serialize_fields(self, fields):
+        """Solo los campos pedidos, sin tocar el resto (no dispara cargas con load_only)."""
+        getters = {
+            "id": lambda: str(self.id),
+            "email": lambda: self.email,
+            "username": lambda: self.username,
+            "is_active": lambda: self.is_active,
+            "image_avatar": lambda: self.image_avatar or self.DEFAULT_AVATAR_URL,
+            "current_reading_isbn": lambda: self.current_reading_isbn,
         }
+        return {field: getters[field]() for field in fields}
 
     def get_favorite_genres_list(self):
         if not self.favorite_genres:
@@ -102,10 +179,19 @@ class User(db.Model):
         except Exception:
             return []
 
+# Unicidad de username sin distinguir mayúsculas (el email ya se guarda en minúsculas)
+db.Index("ix_user_username_lower", db.func.lower(User.username), unique=True)
+# En Postgres, la búsqueda por prefijo de /users (lower(username) LIKE 'abc%') usa además
+# ix_user_username_prefix (varchar_pattern_ops), creado solo en la migración add_user_username_prefix_index
+
 #---- EVENT MODEL ----#
 
 class Event(db.Model):
     __tablename__ = "event"
+    __table_args__ = (
+        db.Index("ix_event_date_time", "date", "time"),
+        db.Index("ix_event_category_date", "category", "date"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(String(100), nullable=False)
@@ -115,6 +201,8 @@ class Event(db.Model):
     location = db.Column(String(120), nullable=False)
     lat = db.Column(Float, nullable=True)
     lng = db.Column(Float, nullable=True)
+    # Geohash de (lat, lng) para búsquedas "cerca de mí" con índice B-tree
+    geohash = db.Column(String(12), nullable=True, index=True)
 
     users = db.relationship(
         "User",
@@ -143,6 +231,13 @@ class Book(db.Model):
     author = db.Column(db.String(500))
     publisher = db.Column(db.String(50))
     thumbnail = db.Column(db.String(500))
+    # Catálogo local: datos completos de Google Books para no volver a pedirlos
+    description = db.Column(db.Text)
+    categories = db.Column(db.Text, default="[]")  # JSON array of strings
+    page_count = db.Column(db.Integer)
+    language = db.Column(db.String(10))
+    published_date = db.Column(db.String(20))
+    fetched_at = db.Column(db.DateTime)  # última sincronización con Google Books (None = nunca)
 
     def serialize(self):
         return {
@@ -152,3 +247,22 @@ class Book(db.Model):
             "publisher": self.publisher,
             "thumbnail": self.thumbnail
         }
+
+    def serialize_details(self):
+        return {
+            **self.serialize(),
+            "description": self.description,
+            "categories": self.get_categories_list(),
+            "pageCount": self.page_count,
+            "language": self.language,
+            "publishedDate": self.published_date,
+        }
+
+    def get_categories_list(self):
+        if not self.categories:
+            return []
+        try:
+            import json
+            return json.loads(self.categories)
+        except Exception:
+            return []
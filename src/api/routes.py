@@ -1,48 +1,53 @@
 """
 This module takes care of starting the API Server, Loading the DB and Adding the endpoints
 """
-from flask import make_response, request, jsonify, Blueprint, Response, stream_with_context
+from flask import make_response, request, jsonify, Blueprint, Response, stream_with_context, g
 import os
-from api.models import Event, db, User, Book, UserTop3
-from stream_chat import StreamChat
+import hmac
+from api.models import Event, db, User, Book, UserTop3, ChatChannel
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload, load_only
 import jwt
 from datetime import datetime, timedelta
 from flask import current_app
 from flask import request, jsonify
-from api.utils_scripts.auth_utils import create_refresh_token, verify_token, create_token, verify_refresh_token
+from api.utils_scripts.auth_utils import create_refresh_token, create_token, verify_refresh_token, require_auth, optional_auth, load_current_user, normalize_email
+from api.utils_scripts.books_cache import MISSING, get_search_cache, search_cache_key
+from api.utils_scripts.book_catalog import normalize_isbn, parse_volume, save_volumes, mark_fetched, is_fresh
+from api.utils_scripts import auth_utils, password_hashing, google_books, stream_client, stream_sync, gemini_client, chat_history
+from api.utils_scripts.chat_history import build_prompt
+from api.utils_scripts.ai_response_cache import get_ai_response_cache
+from api.utils_scripts.random_book_pool import get_random_book_pool
+from api.utils_scripts.ai_streams import StreamRejected, get_stream_limiter, heartbeat_seconds, relay
+from api.utils_scripts.stream_sync import enqueue_user_sync, sync_users_if_changed
+from api.utils_scripts.stream_client import get_stream_client
+from api.utils_scripts.chat_channels import upsert_channel, channel_data, apply_webhook_event, verify_signature
+from api.utils_scripts.user_library import add_to_library, remove_from_library, library_page
+from api.utils_scripts.db_utils import escape_like
+from api.utils_scripts.geo import encode_geohash, covering_cells, prefix_range, haversine_km
+from api.utils_scripts.pagination import encode_cursor, decode_cursor, parse_limit, keyset_after, order_by_keys
+from api.utils_scripts.google_books import GoogleBooksError, fetch_volumes, lookup_isbns
 import requests
 import json
-import random
+import time
 
 
 api = Blueprint('api', __name__)
 
-def normalize_isbn(isbn: str) -> str:
-    return (isbn or "").replace("-", "").replace(" ", "").upper()
-
 
 def generate_stream_token(user):
+    """
+    Token de Stream para el usuario. Firmar el token es local; el restore/upsert del
+    usuario en Stream se encola y lo hace el worker de stream_sync fuera de la petición.
+    """
     try:
         client = get_stream_client()
         if not client:
             return None
 
-        user_id = str(user.id)
-        avatar_url = user.image_avatar if user.image_avatar else User.DEFAULT_AVATAR_URL
-
-        try:
-            client.restore_users([user_id])
-        except Exception:
-            pass
-
-        client.upsert_user({
-            "id": user_id,
-            "name": user.username,
-            "email": user.email,
-            "image": avatar_url,
-        })
-
-        return client.create_token(user_id)
+        enqueue_user_sync(user.id, restore=True)
+        return client.create_token(str(user.id))
     except Exception as e:
         print(f"Error generating Stream token: {e}")
         return None
@@ -51,25 +56,26 @@ def generate_stream_token(user):
 
 @api.route("/signup", methods=["POST"])
 def signup():
-    data = request.get_json()
+    data = request.get_json() or {}
 
-    username = data.get("username")
-    email = data.get("email")
+    username = (data.get("username") or "").strip()
+    email = normalize_email(data.get("email"))
     password = data.get("password")
 
     if not username or not email or not password:
         return jsonify({"message": "Username, email and password are required"}), 400
 
-    if User.query.filter(
-        (User.email==email) & (User.username == username)
-        ).first():
-        return jsonify({"message": "User already exists"}), 409
-
     user = User(username=username, email=email, is_active=True)
     user.set_password(password)
 
+    # Sin consulta previa: los índices únicos (email, lower(username)) deciden, también
+    # cuando dos registros iguales llegan a la vez
     db.session.add(user)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"message": "User already exists"}), 409
 
     return jsonify(user.serialize()), 201
 
@@ -78,7 +84,7 @@ def signup():
 @api.route("/login", methods=["POST"])
 def login():
     data = request.get_json() or {}
-    email = data.get("email")
+    email = normalize_email(data.get("email"))
     password = data.get("password")
 
     if not email or not password:
@@ -89,6 +95,10 @@ def login():
     if not user or not user.check_password(password):
         return jsonify({"message": "Invalid credentials"}), 401
 
+    # Hash con método/parámetros antiguos: se actualiza ahora que tenemos la contraseña en claro
+    if user.upgrade_password_hash(password):
+        db.session.commit()
+
     access_token = create_token(user.id)
     refresh_token = create_refresh_token(user.id)
 
@@ -129,25 +139,91 @@ def refresh_token():
 #----RUTAS DE USUARIOS----#
 
 @api.route("/me", methods=["GET"])
+@require_auth
 def get_current_user():
     """Devuelve el usuario actual a partir del token. Para no depender de localStorage con datos de usuario."""
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return jsonify({"message": "Missing or invalid Authorization header"}), 401
-    token = auth_header.split(" ")[1]
-    user_id = verify_token(token)
-    if not user_id:
-        return jsonify({"message": "Invalid or expired token"}), 401
-    user = User.query.get(user_id)
+    user = load_current_user()
     if not user:
         return jsonify({"message": "User not found"}), 404
     return jsonify(user.serialize()), 200
 
 
+USER_LIST_FIELD_COLUMNS = {
+    "id": User.id,
+    "email": User.email,
+    "username": User.username,
+    "is_active": User.is_active,
+    "image_avatar": User.image_avatar,
+    "current_reading_isbn": User.current_reading_isbn,
+}
+
+
 @api.route('/users', methods=['GET'])
 def get_users():
-    users = User.query.all()
-    return jsonify([u.serialize() for u in users]), 200
+    """
+    Usuarios paginados por cursor.
+
+    Query params (todos opcionales):
+    - limit: tamaño de página (por defecto 100, máximo 500).
+    - cursor: valor de la cabecera X-Next-Cursor de la página anterior.
+    - fields: campos separados por comas (id, email, username, is_active, image_avatar,
+      current_reading_isbn); solo se leen esas columnas. Por defecto, todos.
+    - q: prefijo del username, sin distinguir mayúsculas. Ordena por username; sin q, por id.
+
+    El cuerpo sigue siendo una lista y se genera fila a fila; si hay más páginas se indica en X-Next-Cursor.
+    """
+    fields = request.args.get("fields")
+    fields = [f.strip() for f in fields.split(",") if f.strip()] if fields else list(User.PUBLIC_FIELDS)
+    unknown = [f for f in fields if f not in USER_LIST_FIELD_COLUMNS]
+    if unknown:
+        return jsonify({"msg": f"Unknown fields: {', '.join(unknown)}"}), 400
+
+    prefix = (request.args.get("q") or "").strip().lower()
+    if prefix:
+        keys = [(db.func.lower(User.username), False), (User.id, False)]
+    else:
+        keys = [(User.id, False)]
+
+    try:
+        limit = parse_limit(request.args.get("limit"), default=100, maximum=500)
+        cursor = request.args.get("cursor")
+        after = None
+        if cursor:
+            after = decode_cursor(cursor, (str, int) if prefix else (int,))
+    except ValueError as e:
+        return jsonify({"msg": f"Invalid query params: {str(e)}"}), 400
+
+    query = User.query
+    if prefix:
+        # Prefijo sobre lower(username): usa el índice de lower(username)
+        query = query.filter(db.func.lower(User.username).like(escape_like(prefix) + "%", escape="\\"))
+    if after:
+        query = query.filter(keyset_after(keys, after))
+    query = query.order_by(*order_by_keys(keys))
+
+    # Primero solo las claves de orden (limit + 1) para saber dónde acaba la página y si hay siguiente
+    page_keys = query.with_entities(*[column for column, _ in keys]).limit(limit + 1).all()
+    headers = {}
+    if len(page_keys) > limit:
+        headers["X-Next-Cursor"] = encode_cursor(list(page_keys[limit - 1]))
+    page_keys = page_keys[:limit]
+    if not page_keys:
+        return jsonify([]), 200
+
+    columns = [USER_LIST_FIELD_COLUMNS[f] for f in fields]
+    rows = (
+        query.filter(~keyset_after(keys, list(page_keys[-1])))
+        .options(load_only(*columns))
+        .yield_per(100)
+    )
+
+    def generate():
+        yield "["
+        for i, user in enumerate(rows):
+            yield ("," if i else "") + json.dumps(user.serialize_fields(fields))
+        yield "]"
+
+    return Response(stream_with_context(generate()), status=200, mimetype="application/json", headers=headers)
 
 @api.route('/users/<int:user_id>', methods=['GET'])
 def get_user(user_id):
@@ -162,6 +238,7 @@ def update_user(user_id):
     user = User.query.get(user_id)
     if not user:
         return jsonify({"message": "User not found"}), 404
+    before = (user.username, user.image_avatar)
     if 'username' in data and data['username']:
         user.username = data['username'].strip()
     img = data.get('image_avatar')
@@ -169,7 +246,14 @@ def update_user(user_id):
         img = img.strip()
         if img and (img.startswith('http://') or img.startswith('https://')):
             user.image_avatar = img
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"message": "Username already taken"}), 409
+    # Nombre o avatar nuevos: que el chat los vea sin tener que volver a iniciar sesión
+    if (user.username, user.image_avatar) != before:
+        enqueue_user_sync(user.id)
     return jsonify(user.serialize()), 200
 
 @api.route('/users/<int:user_id>', methods=['DELETE'])
@@ -179,80 +263,98 @@ def delete_user(user_id):
         return jsonify({"message": "User not found"}), 404
     db.session.delete(user)
     db.session.commit()
+
+
+#----METRICAS----#
+
+@api.route("/metrics", methods=["GET"])
+def get_metrics():
+    """
+    Contadores internos (caches, llamadas externas) para diagnóstico de rendimiento.
+    Solo con la cabecera X-Metrics-Token igual a METRICS_TOKEN; sin METRICS_TOKEN la ruta no existe.
+    """
+    expected = os.getenv("METRICS_TOKEN")
+    if not expected:
+        return jsonify({"message": "Not found"}), 404
+    if not hmac.compare_digest(request.headers.get("X-Metrics-Token", "").encode(), expected.encode()):
+        return jsonify({"message": "Invalid metrics token"}), 401
+    return jsonify({
+        "auth": auth_utils.stats(),
+        "password_hashing": password_hashing.stats(),
+        "books_search_cache": get_search_cache().stats(),
+        "google_books": google_books.stats(),
+        "stream": stream_client.stats(),
+        "stream_sync": stream_sync.stats(),
+        "gemini": gemini_client.stats(),
+        "ai_chat_history": chat_history.stats(),
+        "ai_response_cache": get_ai_response_cache().stats(),
+        "random_book_pool": get_random_book_pool().stats(),
+        "ai_streams": get_stream_limiter().stats(),
+    }), 200
+
+
+#----RUTAS DE LIBROS----#
+
 @api.route("/books/search", methods=["GET"])
 def books_search():
     title = request.args.get("title", "").strip()
     if not title:
         return jsonify({"message": "Missing 'title' query param"}), 400
+    lang = request.args.get("langRestrict", "es").strip() or "es"
+
+    # Las búsquedas repetidas (mismo título normalizado + idioma) se sirven desde cache
+    cache = get_search_cache()
+    cache_key = search_cache_key(title, lang)
+    cached = cache.get(cache_key)
+    if cached is not MISSING:
+        return jsonify(cached), 200
 
-    url = "https://www.googleapis.com/books/v1/volumes"
     params = {
         "q": f"intitle:{title}",
         "maxResults": 10,
-        "langRestrict": "es",
+        "langRestrict": lang,
         "printType": "books",
     }
-    
-    google_books_api_key = os.getenv("GOOGLE_BOOKS_API_KEY")
-    if google_books_api_key:
-        params["key"] = google_books_api_key
 
     try:
-        r = requests.get(
-            url,
-            params=params,
-            timeout=10,
-            headers={"User-Agent": "Mozilla/5.0"}
-        )
+        data = fetch_volumes(params)
     except requests.RequestException as e:
         return jsonify({
             "message": "Error connecting to Google Books",
             "error": str(e)
         }), 502
-
-    if r.status_code == 429:
-        return jsonify({
-            "message": "Se ha excedido el límite de búsquedas. Intenta de nuevo en unos minutos.",
-            "error": "rate_limit"
-        }), 429
-
-    if r.status_code != 200:
+    except GoogleBooksError as e:
+        if e.status_code == 429:
+            return jsonify({
+                "message": "Se ha excedido el límite de búsquedas. Intenta de nuevo en unos minutos.",
+                "error": "rate_limit"
+            }), 429
         return jsonify({
             "message": "Google Books returned non-200",
-            "status_code": r.status_code,
-            "body": r.text[:300]
+            "status_code": e.status_code,
+            "body": e.body
         }), 502
 
-    data = r.json()
     items = data.get("items", []) or []
 
-    normalized = []
-    for it in items:
-        vi = it.get("volumeInfo", {}) or {}
-        img = (vi.get("imageLinks", {}) or {})
-
-        isbn = None
-        identifiers = vi.get("industryIdentifiers", []) or []
-        for ident in identifiers:
-            if ident.get("type") in ["ISBN_13", "ISBN_10"]:
-                isbn = ident.get("identifier")
-                break
-            if not isbn:
-                for ident in identifiers:
-                    if "ISBN" in (ident.get("type", "") or ""):
-                        isbn = ident.get("identifier")
-                        break
-
-        normalized.append({
-            "id": it.get("id"),
-            "title": vi.get("title"),
-            "authors": vi.get("authors", []),
-            "publishedDate": vi.get("publishedDate"),
-            "thumbnail": img.get("thumbnail") or img.get("smallThumbnail"),
-            "isbn" : isbn
-        })
+    volumes = [parse_volume(it) for it in items]
+    save_volumes(volumes)
+
+    normalized = [
+        {
+            "id": v["id"],
+            "title": v["title"],
+            "authors": v["authors"],
+            "publishedDate": v["publishedDate"],
+            "thumbnail": v["thumbnail"],
+            "isbn": v["isbn"],
+        }
+        for v in volumes
+    ]
 
-    return jsonify({"totalItems": data.get("totalItems", 0), "items": normalized}), 200
+    result = {"totalItems": data.get("totalItems", 0), "items": normalized}
+    cache.set(cache_key, result, negative=not normalized)
+    return jsonify(result), 200
 
 
 @api.route("/books/by-isbn", methods=["GET"])
@@ -263,44 +365,107 @@ def books_by_isbn():
     if not isbn:
         return jsonify({"message": "isbn required"}), 400
 
-    # Si está en nuestra BD (p. ej. de library/current-reading), devolver thumbnail y title
+    # Catálogo local: si ya se sincronizó con Google Books y no ha caducado, no salimos a la red
     book = Book.query.get(isbn)
-    if book:
-        out = {
-            "description": None,
-            "thumbnail": book.thumbnail,
-            "title": book.title,
-        }
-        return jsonify(out), 200
-
-    url = "https://www.googleapis.com/books/v1/volumes"
-    params = {"q": f"isbn:{isbn}", "maxResults": 1}
-    google_books_api_key = os.getenv("GOOGLE_BOOKS_API_KEY")
-    if google_books_api_key:
-        params["key"] = google_books_api_key
+    if is_fresh(book):
+        return jsonify(book.serialize_details()), 200
 
     try:
-        r = requests.get(url, params=params, timeout=10, headers={"User-Agent": "Mozilla/5.0"})
-    except requests.RequestException as e:
-        return jsonify({"message": "Error connecting to Google Books", "error": str(e)}), 502
-
-    if r.status_code == 429:
-        return jsonify({"message": "Se ha excedido el límite de búsquedas. Intenta de nuevo en unos minutos.", "error": "rate_limit"}), 429
-    if r.status_code != 200:
-        return jsonify({"message": "Google Books error", "status_code": r.status_code}), 502
+        data = fetch_volumes({"q": f"isbn:{isbn}", "maxResults": 1})
+    except (requests.RequestException, GoogleBooksError) as e:
+        # Si Google falla pero tenemos una copia (aunque sea antigua), mejor servirla que devolver error
+        if book:
+            return jsonify(book.serialize_details()), 200
+        if isinstance(e, requests.RequestException):
+            return jsonify({"message": "Error connecting to Google Books", "error": str(e)}), 502
+        if e.status_code == 429:
+            return jsonify({"message": "Se ha excedido el límite de búsquedas. Intenta de nuevo en unos minutos.", "error": "rate_limit"}), 429
+        return jsonify({"message": "Google Books error", "status_code": e.status_code}), 502
 
-    data = r.json()
     items = data.get("items", []) or []
     if not items:
+        if book:
+            mark_fetched(book)
+            return jsonify(book.serialize_details()), 200
         return jsonify({"description": None, "thumbnail": None, "title": None}), 200
 
-    item = items[0]
-    vi = item.get("volumeInfo", {}) or {}
-    description = vi.get("description") or None
-    img = (vi.get("imageLinks", {}) or {})
-    thumbnail = img.get("thumbnail") or img.get("smallThumbnail")
-    title = vi.get("title")
-    return jsonify({"description": description, "thumbnail": thumbnail, "title": title}), 200
+    volume = parse_volume(items[0])
+    # Guardar con el ISBN pedido (Google puede devolver el ISBN_10 cuando se pidió el 13 o viceversa)
+    volume["isbn"] = isbn
+    saved = save_volumes([volume])
+    if saved:
+        return jsonify(saved[0].serialize_details()), 200
+    return jsonify({
+        "description": volume["description"] or None,
+        "thumbnail": volume["thumbnail"],
+        "title": volume["title"],
+    }), 200
+
+
+@api.route("/books/by-isbn/batch", methods=["POST"])
+def books_by_isbn_batch():
+    """
+    Resuelve muchos ISBN en una sola petición: {"isbns": [...]} -> {"books": {isbn: libro|null}}.
+    Los que están en el catálogo local salen de una única consulta IN; del resto se piden
+    a Google Books en paralelo como mucho GOOGLE_BOOKS_MAX_LOOKUPS_PER_REQUEST. Los que
+    quedan sin consultar van en "pending" (con los datos locales si los hay) para que el
+    cliente los vuelva a pedir. Los ISBN cuya consulta falló aparecen también en "errors".
+    """
+    data = request.get_json(silent=True) or {}
+    raw_isbns = data.get("isbns")
+    if not isinstance(raw_isbns, list) or not raw_isbns:
+        return jsonify({"message": "isbns must be a non-empty array"}), 400
+
+    # Normalizar y quitar duplicados conservando el orden
+    isbns = [i for i in dict.fromkeys(normalize_isbn(str(x)) for x in raw_isbns if x) if i]
+    max_isbns = int(os.getenv("BOOKS_BATCH_MAX_ISBNS", "300"))
+    if len(isbns) > max_isbns:
+        return jsonify({"message": f"At most {max_isbns} isbns per request"}), 400
+
+    books = {b.isbn: b for b in Book.query.filter(Book.isbn.in_(isbns)).all()} if isbns else {}
+    result = {}
+    misses = []
+    for isbn in isbns:
+        book = books.get(isbn)
+        if is_fresh(book):
+            result[isbn] = book.serialize_details()
+        else:
+            misses.append(isbn)
+
+    # Acotar las llamadas salientes por petición (timeout del worker y cuota de la API)
+    max_lookups = int(os.getenv("GOOGLE_BOOKS_MAX_LOOKUPS_PER_REQUEST", "20"))
+    misses, pending = misses[:max_lookups], misses[max_lookups:]
+    for isbn in pending:
+        book = books.get(isbn)
+        result[isbn] = book.serialize_details() if book else None
+
+    errors = {}
+    volumes = []
+    not_found = []
+    for isbn, outcome in lookup_isbns(misses).items():
+        book = books.get(isbn)
+        if isinstance(outcome, dict):
+            outcome["isbn"] = isbn
+            volumes.append(outcome)
+            continue
+        if isinstance(outcome, Exception):
+            rate_limited = isinstance(outcome, GoogleBooksError) and outcome.status_code == 429
+            errors[isbn] = "rate_limit" if rate_limited else "unavailable"
+        elif book:
+            not_found.append(book)
+        result[isbn] = book.serialize_details() if book else None
+
+    mark_fetched(*not_found)
+    saved = {b.isbn: b for b in save_volumes(volumes)}
+    for volume in volumes:
+        book = saved.get(volume["isbn"])
+        result[volume["isbn"]] = book.serialize_details() if book else {
+            "description": volume["description"] or None,
+            "thumbnail": volume["thumbnail"],
+            "title": volume["title"],
+        }
+
+    return jsonify({"books": result, "count": len(result), "errors": errors, "pending": pending}), 200
 
 
 #----RUTAS DE EVENTOS----#
@@ -319,8 +484,113 @@ def get_user_events(user_id):
 
 @api.route("/events", methods=["GET"])
 def get_all_events():
-    events = Event.query.order_by(Event.date.asc(), Event.time.asc()).all()
-    return jsonify([e.serialize() for e in events]), 200
+    """
+    Eventos ordenados por fecha y hora, paginados por cursor.
+
+    Query params (todos opcionales):
+    - limit: tamaño de página (máximo 500). Sin limit ni cursor se devuelven todos los eventos.
+    - cursor: valor de la cabecera X-Next-Cursor de la página anterior (limit por defecto 100).
+    - from / to: rango de fechas YYYY-MM-DD (inclusive).
+    - category: solo eventos de esa categoría.
+    - upcoming: 1 (por defecto) solo eventos desde hoy; 0 incluye los pasados. "from" tiene prioridad.
+
+    El cuerpo sigue siendo una lista; si hay más páginas se indica en X-Next-Cursor.
+    """
+    try:
+        cursor = request.args.get("cursor")
+        limit = parse_limit(request.args.get("limit"), default=100 if cursor else None, maximum=500)
+        date_from = request.args.get("from")
+        date_to = request.args.get("to")
+        date_from = datetime.strptime(date_from, "%Y-%m-%d").date() if date_from else None
+        date_to = datetime.strptime(date_to, "%Y-%m-%d").date() if date_to else None
+        after = None
+        if cursor:
+            cursor_date, cursor_time, cursor_id = decode_cursor(cursor, (str, str, int))
+            after = (
+                datetime.strptime(cursor_date, "%Y-%m-%d").date(),
+                datetime.strptime(cursor_time, "%H:%M:%S").time(),
+                cursor_id,
+            )
+    except ValueError as e:
+        return jsonify({"msg": f"Invalid query params: {str(e)}"}), 400
+
+    upcoming = request.args.get("upcoming", "1").lower() not in ("0", "false", "no")
+    if date_from is None and upcoming:
+        date_from = datetime.utcnow().date()
+
+    keys = [(Event.date, False), (Event.time, False), (Event.id, False)]
+    query = Event.query
+    category = request.args.get("category")
+    if category:
+        query = query.filter(Event.category == category)
+    if date_from:
+        query = query.filter(Event.date >= date_from)
+    if date_to:
+        query = query.filter(Event.date <= date_to)
+    if after:
+        query = query.filter(keyset_after(keys, after))
+
+    query = query.order_by(*order_by_keys(keys))
+    if limit is None:
+        return jsonify([e.serialize() for e in query.all()]), 200
+
+    # Se pide una fila de más para saber si hay página siguiente sin hacer COUNT
+    events = query.limit(limit + 1).all()
+    response = jsonify([e.serialize() for e in events[:limit]])
+    if len(events) > limit:
+        last = events[limit - 1]
+        response.headers["X-Next-Cursor"] = encode_cursor(
+            [last.date.isoformat(), last.time.strftime("%H:%M:%S"), last.id]
+        )
+    return response, 200
+
+
+@api.route("/events/nearby", methods=["GET"])
+def get_nearby_events():
+    """
+    Eventos cerca de un punto, ordenados por distancia: ?lat=&lng=&radius_km= (por defecto 10 km).
+    Solo se leen los eventos de las celdas geohash que cubren el círculo (rangos sobre el
+    índice de event.geohash); después se calcula la distancia exacta y se descartan los de fuera.
+    Acepta también limit (por defecto 50, máximo 200) y upcoming (1 por defecto).
+    """
+    try:
+        lat = float(request.args["lat"])
+        lng = float(request.args["lng"])
+    except (KeyError, ValueError):
+        return jsonify({"msg": "lat and lng are required numbers"}), 400
+    try:
+        radius_km = float(request.args.get("radius_km", 10))
+    except ValueError:
+        return jsonify({"msg": "radius_km must be a number"}), 400
+    try:
+        limit = parse_limit(request.args.get("limit"), default=50, maximum=200)
+    except ValueError:
+        return jsonify({"msg": "limit must be an integer"}), 400
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180) or not 0 < radius_km <= 1000:
+        return jsonify({"msg": "lat/lng out of range or radius_km not in (0, 1000]"}), 400
+
+    query = Event.query.filter(Event.geohash.isnot(None))
+    cells = covering_cells(lat, lng, radius_km)
+    if cells:
+        ranges = []
+        for cell in cells:
+            start, end = prefix_range(cell)
+            ranges.append(and_(Event.geohash >= start, Event.geohash < end) if end else Event.geohash >= start)
+        query = query.filter(or_(*ranges))
+    if request.args.get("upcoming", "1").lower() not in ("0", "false", "no"):
+        query = query.filter(Event.date >= datetime.utcnow().date())
+
+    nearby = []
+    for event in query.all():
+        distance = haversine_km(lat, lng, event.lat, event.lng)
+        if distance <= radius_km:
+            nearby.append((distance, event))
+    nearby.sort(key=lambda pair: pair[0])
+
+    return jsonify([
+        {**event.serialize(), "distance_km": round(distance, 3)}
+        for distance, event in nearby[:limit]
+    ]), 200
 
 
 @api.route("/events", methods=["POST"])
@@ -359,6 +629,12 @@ def create_event():
             except (ValueError, TypeError):
                 lng_float = None
 
+        if lat_float is not None and not -90 <= lat_float <= 90:
+            lat_float = None
+        if lng_float is not None and not -180 <= lng_float <= 180:
+            lng_float = None
+        has_coords = lat_float is not None and lng_float is not None
+
         event = Event(
             title=title,
             date=date_obj,
@@ -366,7 +642,8 @@ def create_event():
             category=category,
             location=location,
             lat=lat_float,
-            lng=lng_float
+            lng=lng_float,
+            geohash=encode_geohash(lat_float, lng_float) if has_coords else None,
         )
 
         db.session.add(event)
@@ -383,17 +660,8 @@ def create_event():
 
 
 @api.route("/events/<int:event_id>", methods=["DELETE"])
+@require_auth
 def delete_event(event_id):
-    
-    auth_header = request.headers.get("Authorization") or ""
-    user_id = None
-    if auth_header.startswith("Bearer "):
-        token = auth_header.split(" ", 1)[1].strip()
-        user_id = verify_token(token)
-
-    if not user_id:
-        return jsonify({"msg": "Missing or invalid auth token"}), 401
-
     event = Event.query.get(event_id)
     if not event:
         return jsonify({"msg": "Event not found"}), 404
@@ -405,15 +673,10 @@ def delete_event(event_id):
     return jsonify({"msg": "Event deleted"}), 200
 
 @api.route("/events/<int:event_id>/signup", methods=["POST"])
+@optional_auth
 def singup_to_event(event_id):
     data = request.get_json(silent=True) or {}
-    user_id = data.get("user_id")
-
-    if not user_id:
-        auth_header = request.headers.get("Authorization") or ""
-        if auth_header.startswith("Bearer "):
-            token = auth_header.split(" ", 1)[1].strip()
-            user_id = verify_token(token)
+    user_id = data.get("user_id") or g.user_id
 
     if not user_id:
         return jsonify({"msg": "Missing user_id"}), 400
@@ -434,15 +697,10 @@ def singup_to_event(event_id):
 
 
 @api.route("/events/<int:event_id>/signup", methods=["DELETE"])
+@optional_auth
 def unsingup_from_event(event_id):
     data = request.get_json(silent=True) or {}
-    user_id = data.get("user_id")
-
-    if not user_id:
-        auth_header = request.headers.get("Authorization") or ""
-        if auth_header.startswith("Bearer "):
-            token = auth_header.split(" ", 1)[1].strip()
-            user_id = verify_token(token)
+    user_id = data.get("user_id") or g.user_id
 
     if not user_id:
         return jsonify({"msg": "Missing user_id"}), 400
@@ -476,41 +734,16 @@ def get_event_users(event_id):
 
 #----RUTAS DE STREAM CHAT----#
 
-def get_stream_client():
-    api_key = os.getenv("STREAM_API_KEY")
-    api_secret = os.getenv("STREAM_API_SECRET")
-
-    if not api_key or not api_secret:
-        raise ValueError("STREAM_API_KEY and STREAM_API_SECRET must be set in environment variables")
-
-    return StreamChat(api_key=api_key, api_secret=api_secret)
-
-
 @api.route("/stream-token", methods=["GET"])
+@require_auth
 def get_stream_token():
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return jsonify({"message": "Missing or invalid Authorization header"}), 401
-
-    token = auth_header.split(" ")[1]
-    user_id = verify_token(token)
-
-    if not user_id:
-        return jsonify({"message": "Invalid or expired token"}), 401
-
-    user = User.query.get(user_id)
+    user = load_current_user()
     if not user:
         return jsonify({"message": "User not found"}), 404
 
     try:
         client = get_stream_client()
-        avatar_url = user.image_avatar if user.image_avatar else User.DEFAULT_AVATAR_URL
-        client.upsert_user({
-            "id": str(user.id),
-            "name": user.username,
-            "email": user.email,
-            "image": avatar_url,
-        })
+        enqueue_user_sync(user.id)
         stream_token = client.create_token(str(user.id))
 
         return jsonify({
@@ -526,50 +759,27 @@ def get_stream_token():
 
 
 @api.route("/chat/sync-my-avatar", methods=["POST"])
+@require_auth
 def sync_my_avatar():
     """
     Sincroniza el avatar del usuario autenticado desde la BD a Stream Chat.
     Debe llamarse después de que el usuario guarde su foto de perfil, para que
     la nueva imagen aparezca en el chat sin tener que volver a iniciar sesión.
     """
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return jsonify({"message": "Missing or invalid Authorization header"}), 401
-
-    token = auth_header.split(" ")[1]
-    user_id = verify_token(token)
-    if not user_id:
-        return jsonify({"message": "Invalid or expired token"}), 401
-
-    user = User.query.get(user_id)
+    user = load_current_user()
     if not user:
         return jsonify({"message": "User not found"}), 404
 
-    try:
-        client = get_stream_client()
-        avatar_url = user.image_avatar if user.image_avatar else User.DEFAULT_AVATAR_URL
-        client.upsert_user({
-            "id": str(user.id),
-            "name": user.username,
-            "email": user.email,
-            "image": avatar_url,
-        })
-        return jsonify({"ok": True, "image": avatar_url}), 200
-    except Exception as e:
-        return jsonify({"message": f"Error syncing avatar: {str(e)}"}), 500
+    # El upsert a Stream lo hace el worker de stream_sync en segundo plano
+    avatar_url = user.image_avatar if user.image_avatar else User.DEFAULT_AVATAR_URL
+    enqueue_user_sync(user.id)
+    return jsonify({"ok": True, "image": avatar_url, "queued": True}), 200
 
 
 @api.route("/chat/create-channel", methods=["POST"])
+@require_auth
 def create_channel():
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return jsonify({"message": "Missing or invalid Authorization header"}), 401
-
-    token = auth_header.split(" ")[1]
-    user_id = verify_token(token)
-
-    if not user_id:
-        return jsonify({"message": "Invalid or expired token"}), 401
+    user_id = g.user_id
     data = request.get_json() or {}
     channel_id = data.get("channel_id")
     book_title = data.get("book_title")
@@ -596,7 +806,8 @@ def create_channel():
             }
         )
 
-        channel.create(user_id_str)
+        created = channel.create(user_id_str)
+        upsert_channel(channel_id, {"name": f"📚 {book_title}", "book_title": book_title, **channel_data(created)})
 
         return jsonify({
             "message": "Channel created successfully",
@@ -609,21 +820,15 @@ def create_channel():
 
 
 @api.route("/chat/join-channel/<channel_id>", methods=["POST"])
+@require_auth
 def join_channel(channel_id):
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return jsonify({"message": "Missing or invalid Authorization header"}), 401
-
-    token = auth_header.split(" ")[1]
-    user_id = verify_token(token)
-
-    if not user_id:
-        return jsonify({"message": "Invalid or expired token"}), 401
+    user_id = g.user_id
 
     try:
         client = get_stream_client()
         channel = client.channel("messaging", channel_id)
-        channel.add_members([str(user_id)])
+        joined = channel.add_members([str(user_id)])
+        upsert_channel(channel_id, channel_data(joined))
 
         return jsonify({
             "message": "Successfully joined channel",
@@ -635,54 +840,81 @@ def join_channel(channel_id):
 
 
 @api.route("/chat/public-channels", methods=["GET"])
+@require_auth
 def get_public_channels():
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return jsonify({"message": "Missing or invalid Authorization header"}), 401
+    """
+    Canales de libro desde la tabla local chat_channel (no consulta Stream).
 
-    token = auth_header.split(" ")[1]
-    user_id = verify_token(token)
+    Query params (opcionales):
+    - sort: "activity" (por defecto, último mensaje primero) o "members" (más miembros primero).
+    - limit: tamaño de página (por defecto 50, máximo 100).
+    - cursor: next_cursor de la página anterior (también en la cabecera X-Next-Cursor).
+    """
 
-    if not user_id:
-        return jsonify({"message": "Invalid or expired token"}), 401
+    sort = request.args.get("sort", "activity")
+    if sort == "members":
+        keys = [(ChatChannel.member_count, True), (ChatChannel.last_activity_at, True), (ChatChannel.id, True)]
+    elif sort == "activity":
+        keys = [(ChatChannel.last_activity_at, True), (ChatChannel.id, True)]
+    else:
+        return jsonify({"message": "sort must be 'activity' or 'members'"}), 400
 
+    try:
+        limit = parse_limit(request.args.get("limit"), default=50, maximum=100)
+        after = None
+        cursor = request.args.get("cursor")
+        if cursor:
+            *head, last_activity, channel_id = decode_cursor(cursor, (int,) * (len(keys) - 2) + (str, str))
+            after = head + [datetime.fromisoformat(last_activity), channel_id]
+    except ValueError as e:
+        return jsonify({"message": f"Invalid query params: {str(e)}"}), 400
+
+    query = ChatChannel.query
+    if after:
+        query = query.filter(keyset_after(keys, after))
+    channels = query.order_by(*order_by_keys(keys)).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(channels) > limit:
+        last = channels[limit - 1]
+        values = [last.last_activity_at.isoformat(), last.id]
+        if sort == "members":
+            values.insert(0, last.member_count)
+        next_cursor = encode_cursor(values)
+
+    channel_list = [ch.serialize() for ch in channels[:limit]]
+    response = jsonify({
+        "channels": channel_list,
+        "count": len(channel_list),
+        "next_cursor": next_cursor,
+    })
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response, 200
+
+
+@api.route("/chat/webhook", methods=["POST"])
+def stream_chat_webhook():
+    """
+    Webhook de Stream Chat (configurarlo en el dashboard apuntando a /api/chat/webhook).
+    Mantiene al día la tabla chat_channel: mensajes nuevos, miembros y canales borrados.
+    """
+    body = request.get_data()
     try:
         client = get_stream_client()
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 500
+    if not verify_signature(body, request.headers.get("X-Signature"), client.api_secret):
+        return jsonify({"message": "Invalid signature"}), 401
 
-        channels = client.query_channels(
-            filter_conditions={
-                "type": "messaging",
-            },
-            sort=[{"last_message_at": -1}],
-            limit=100
-        )
-
-        channel_list = []
-        for ch in channels.get("channels", []):
-            channel_data = ch.get("channel", {})
-            channel_id = channel_data.get("id", "")
-
-            if channel_id.startswith("book-"):
-                channel_list.append({
-                    "id": channel_id,
-                    "name": channel_data.get("name"),
-                    "book_title": channel_data.get("book_title"),
-                    "member_count": channel_data.get("member_count", 0),
-                    "created_at": channel_data.get("created_at"),
-                    "last_message_at": channel_data.get("last_message_at"),
-                    "created_by_id": channel_data.get("created_by_id"),
-                })
-
-        return jsonify({
-            "channels": channel_list,
-            "count": len(channel_list)
-        }), 200
-
-    except Exception as e:
-        return jsonify({"message": f"Error fetching channels: {str(e)}"}), 500
+    event = request.get_json(silent=True)
+    if not isinstance(event, dict):
+        return jsonify({"message": "Invalid payload"}), 400
+    return jsonify({"ok": True, "applied": apply_webhook_event(event)}), 200
 
 
 @api.route("/chat/create-or-join-channel", methods=["POST"])
+@require_auth
 def create_or_join_channel():
     """
     Crea (si no existe) o une al usuario autenticado a un canal de Stream Chat
@@ -696,15 +928,7 @@ def create_or_join_channel():
     - Asegura que el usuario actual quede como miembro del canal.
     - Devuelve el channel_id y el book_title al frontend.
     """
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return jsonify({"message": "Missing or invalid Authorization header"}), 401
-
-    token = auth_header.split(" ")[1]
-    user_id = verify_token(token)
-
-    if not user_id:
-        return jsonify({"message": "Invalid or expired token"}), 401
+    user_id = g.user_id
 
     data = request.get_json() or {}
     book_title = data.get("book_title")
@@ -737,12 +961,13 @@ def create_or_join_channel():
             }
         )
 
-        channel.create(user_id_str)
+        data = channel_data(channel.create(user_id_str))
 
         try:
-            channel.add_members([user_id_str])
+            data = channel_data(channel.add_members([user_id_str])) or data
         except Exception:
             pass
+        upsert_channel(channel_id, {"name": f"📚 {book_title}", "book_title": book_title, **data})
 
         return jsonify({
             "message": "Successfully joined channel",
@@ -755,6 +980,7 @@ def create_or_join_channel():
 
 
 @api.route("/chat/create-or-join-channel-by-isbn", methods=["POST"])
+@require_auth
 def create_or_join_channel_by_isbn():
     """
     Crea un canal de libro NUEVO o une al usuario si ya existe,
@@ -766,15 +992,7 @@ def create_or_join_channel_by_isbn():
     - Está pensado para que todos los usuarios que leen el mismo ISBN
       acaben SIEMPRE en el mismo canal de chat, aunque el título se escriba distinto.
     """
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return jsonify({"message": "Missing or invalid Authorization header"}), 401
-    
-    token = auth_header.split(" ")[1]
-    user_id = verify_token(token)
-    
-    if not user_id:
-        return jsonify({"message": "Invalid or expired token"}), 401
+    user_id = g.user_id
 
     data = request.get_json() or {}
     isbn = normalize_isbn(data.get("isbn"))
@@ -804,15 +1022,17 @@ def create_or_join_channel_by_isbn():
         )
 
         # Crear el canal si no existe; si ya existe, simplemente asegurarse de que el usuario es miembro.
+        data = {}
         try:
-            channel.create(user_id_str)
+            data = channel_data(channel.create(user_id_str))
         except Exception:
             try:
-                channel.add_members([user_id_str])
+                data = channel_data(channel.add_members([user_id_str]))
             except Exception:
                 # Si ya es miembro o hay cualquier otro problema no crítico, lo ignoramos:
                 # desde el punto de vista de la UX el usuario ya está "en el chat".
                 pass
+        upsert_channel(channel_id, {"name": f"📚 {book_title}", "book_title": book_title, "isbn": isbn, **data})
 
         return jsonify(
             {
@@ -827,20 +1047,32 @@ def create_or_join_channel_by_isbn():
         return jsonify({"message": f"Error creating/joining channel: {str(e)}"}), 500
 
 
+def _member_images(members_data):
+    """{user_id (int): imagen que Stream tiene ahora} para los miembros de un canal (ids numéricos)."""
+    images = {}
+    for m in members_data:
+        u = m.get("user") or m
+        user_id_str = str(u.get("id") or m.get("user_id") or "")
+        if user_id_str.isdigit():
+            images[int(user_id_str)] = u.get("image")
+    return images
+
+
+def _load_member_users(member_images):
+    """Todos los usuarios de la BD de un canal en una sola consulta IN."""
+    if not member_images:
+        return []
+    return User.query.filter(User.id.in_(list(member_images))).all()
+
+
 @api.route("/chat/sync-channel-avatars", methods=["GET"])
+@require_auth
 def sync_channel_avatars():
     """
     Sincroniza los avatares de los miembros del canal desde la BD a Stream.
     Así todos los usuarios ven las fotos de perfil de los demás en el chat.
     Debe llamarse antes de abrir el canal en el frontend (p. ej. antes de watch()).
     """
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return jsonify({"message": "Missing or invalid Authorization header"}), 401
-
-    token = auth_header.split(" ")[1]
-    if not verify_token(token):
-        return jsonify({"message": "Invalid or expired token"}), 401
 
     channel_id = request.args.get("channel_id")
     if not channel_id:
@@ -849,35 +1081,22 @@ def sync_channel_avatars():
     client = get_stream_client()
     try:
         channel = client.channel("messaging", channel_id)
-        result = channel.query_members(limit=100)
-        members_data = result.get("members", [])
+        # query_members devuelve directamente la lista de miembros
+        members_data = channel.query_members({}, limit=100) or []
     except Exception:
         return jsonify({"ok": True, "synced": 0}), 200
 
-    synced = 0
-    for m in members_data:
-        u = m.get("user") or m
-        user_id_str = u.get("id") or m.get("user_id")
-        if not user_id_str:
-            continue
-        db_user = User.query.get(user_id_str)
-        if not db_user:
-            continue
-        avatar_url = db_user.image_avatar if db_user.image_avatar else User.DEFAULT_AVATAR_URL
-        try:
-            client.upsert_user({
-                "id": str(user_id_str),
-                "name": db_user.username,
-                "email": getattr(db_user, "email", None) or "",
-                "image": avatar_url,
-            })
-            synced += 1
-        except Exception:
-            pass
+    reported = _member_images(members_data)
+    db_users = _load_member_users(reported)
+    try:
+        synced = len(sync_users_if_changed(client, db_users, reported))
+    except Exception:
+        synced = 0
     return jsonify({"ok": True, "synced": synced}), 200
 
 
 @api.route("/chat/channel-members-by-isbn", methods=["GET"])
+@require_auth
 def get_channel_members_by_isbn():
     """
     Devuelve los miembros (id, nombre, imagen) del canal de un libro dado su ISBN.
@@ -887,53 +1106,40 @@ def get_channel_members_by_isbn():
       de lectores que han participado en el chat de ese libro.
     - No crea canales ni modifica nada en Stream, solo consulta miembros (si el canal existe).
     """
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return jsonify({"message": "Missing or invalid Authorization header"}), 401
-
-    token = auth_header.split(" ")[1]
-    user_id = verify_token(token)
-
-    if not user_id:
-        return jsonify({"message": "Invalid or expired token"}), 401
-
     isbn = normalize_isbn(request.args.get("isbn"))
     if not isbn:
         return jsonify({"message": "isbn is required"}), 400
 
     channel_id = f"book-isbn-{isbn}"
-    channel_cid = f"messaging:{channel_id}"
 
     client = get_stream_client()
 
     # Caso 1: intentar obtener miembros desde el propio canal
     try:
         channel = client.channel("messaging", channel_id)
-        result = channel.query_members(limit=50)
-        members_data = result.get("members", [])
+        # query_members devuelve directamente la lista de miembros
+        members_data = channel.query_members({}, limit=50) or []
     except Exception:
         # Caso 2: si el canal aún no existe o falla query_members, devolver lista vacía
         return jsonify({"members": [], "count": 0}), 200
 
+    reported = _member_images(members_data)
+    db_users = {u.id: u for u in _load_member_users(reported)}
+    try:
+        sync_users_if_changed(client, list(db_users.values()), reported)
+    except Exception:
+        pass
+
     users = []
     for m in members_data:
         u = m.get("user") or m
         user_id_str = u.get("id") or m.get("user_id")
         if not user_id_str:
             continue
-        db_user = User.query.get(user_id_str)
+        db_user = db_users.get(int(user_id_str)) if str(user_id_str).isdigit() else None
         image = u.get("image")
         if db_user:
             avatar_url = db_user.image_avatar if db_user.image_avatar else User.DEFAULT_AVATAR_URL
-            if image != avatar_url:
-                try:
-                    client.upsert_user({
-                        "id": str(user_id_str),
-                        "name": db_user.username,
-                        "image": avatar_url,
-                    })
-                except Exception:
-                    pass
             image = image or avatar_url
         elif not image:
             image = User.DEFAULT_AVATAR_URL
@@ -947,13 +1153,46 @@ def get_channel_members_by_isbn():
     return jsonify({"members": users, "count": len(users)}), 200
 
 
+def serialize_library_book(book, added_at):
+    return {**book.serialize(), "added_at": added_at.isoformat() + "Z" if added_at else None}
+
+
 @api.route("/library/<int:user_id>/books", methods=["GET"])
 def get_user_library(user_id):
-    user = User.query.get(user_id)
-    if not user:
+    """
+    Libros de la librería del usuario.
+
+    Query params (todos opcionales):
+    - sort: added (por defecto, más recientes primero), title o author (A-Z).
+    - order: asc o desc para invertir el orden por defecto.
+    - q: texto a buscar en título o autor (sin distinguir mayúsculas).
+    - limit: tamaño de página (máximo 500). Sin limit ni cursor se devuelve la librería entera.
+    - cursor: valor de la cabecera X-Next-Cursor de la página anterior.
+    """
+    if not db.session.query(User.query.filter(User.id == user_id).exists()).scalar():
         return jsonify({"msg": "User not found"}), 404
 
-    return jsonify([book.serialize() for book in user.library_books]), 200
+    order = request.args.get("order")
+    if order not in (None, "asc", "desc"):
+        return jsonify({"msg": "Invalid query params: order must be asc or desc"}), 400
+    try:
+        cursor = request.args.get("cursor")
+        limit = parse_limit(request.args.get("limit"), default=100 if cursor else None, maximum=500)
+        rows, next_cursor = library_page(
+            user_id,
+            sort=request.args.get("sort", "added"),
+            descending=None if order is None else order == "desc",
+            q=(request.args.get("q") or "").strip() or None,
+            limit=limit,
+            after=decode_cursor(cursor, (str, str)) if cursor else None,
+        )
+    except ValueError as e:
+        return jsonify({"msg": f"Invalid query params: {str(e)}"}), 400
+
+    response = jsonify([serialize_library_book(book, added_at) for book, added_at in rows])
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response, 200
 
 
 @api.route("/library/<int:user_id>/books", methods=["POST"])
@@ -976,9 +1215,6 @@ def add_book_to_library(user_id):
     if isinstance(authors, str):
         authors = [authors]
 
-    if any(b.isbn == isbn for b in user.library_books):
-        return jsonify({"msg": "Book already in library"}), 409
-
     book = Book.query.get(isbn)
 
     if not book:
@@ -991,7 +1227,9 @@ def add_book_to_library(user_id):
         )
         db.session.add(book)
 
-    user.library_books.append(book)
+    if not add_to_library(user.id, isbn):
+        db.session.rollback()
+        return jsonify({"msg": "Book already in library"}), 409
     db.session.commit()
 
     return jsonify({"msg": "Book added to library", "book": book.serialize()}), 201
@@ -1005,41 +1243,59 @@ def remove_book_from_library(user_id, isbn):
 
     isbn = normalize_isbn(isbn)
 
-    book = next((b for b in user.library_books if b.isbn == isbn), None)
-    if not book:
+    if not remove_from_library(user.id, isbn):
         return jsonify({"msg": "Book not found in library"}), 404
 
     # Si se elimina un libro que está marcado como current reading, lo quitamos también de ahí
     if user.current_reading_isbn and normalize_isbn(user.current_reading_isbn) == isbn:
         user.current_reading_isbn = None
 
-    user.library_books.remove(book)
     db.session.commit()
 
     return jsonify({"msg": "Book removed from library"}), 200
 
 
-@api.route("/users/<int:user_id>/current-reading", methods=["GET"])
-def get_current_reading(user_id):
-    user = User.query.get(user_id)
-    if not user:
-        return jsonify({"msg": "User not found"}), 404
-
+def serialize_current_reading(user):
+    """(libro actual, history) recorriendo la librería una sola vez; history no repite el actual."""
+    current_isbn_norm = normalize_isbn(user.current_reading_isbn) if user.current_reading_isbn else None
     current_book = None
-    current_isbn_norm = None
-    if user.current_reading_isbn:
-        current_isbn_norm = normalize_isbn(user.current_reading_isbn)
+    history = []
+    for book in user.library_books:
+        if current_isbn_norm and normalize_isbn(book.isbn) == current_isbn_norm:
+            current_book = book.serialize()
+        else:
+            history.append(book.serialize())
+
+    if current_isbn_norm and current_book is None:
+        # El libro actual no está en la librería (datos antiguos): buscarlo aparte
         book = Book.query.get(user.current_reading_isbn)
         if book:
             current_book = book.serialize()
+    return current_book, history
 
-    # History sin el libro actual para no repetirlo
-    history = [
-        book.serialize()
-        for book in user.library_books
-        if normalize_isbn(book.isbn) != current_isbn_norm
-    ]
 
+@api.route("/users/<int:user_id>/current-reading", methods=["GET"])
+def get_current_reading(user_id):
+    """Lectura actual e historial. Con ?history_limit=N el historial son solo los N libros añadidos más recientemente."""
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({"msg": "User not found"}), 404
+
+    try:
+        history_limit = parse_limit(request.args.get("history_limit"), default=None, maximum=500)
+    except ValueError as e:
+        return jsonify({"msg": f"Invalid query params: {str(e)}"}), 400
+
+    if history_limit is None:
+        current_book, history = serialize_current_reading(user)
+        return jsonify({"current": current_book, "history": history}), 200
+
+    current_isbn_norm = normalize_isbn(user.current_reading_isbn) if user.current_reading_isbn else None
+    book = Book.query.get(user.current_reading_isbn) if user.current_reading_isbn else None
+    current_book = book.serialize() if book else None
+    # Una fila de más por si el libro actual está entre los recientes
+    rows, _ = library_page(user.id, sort="added", limit=history_limit + 1)
+    history = [b.serialize() for b, _ in rows if normalize_isbn(b.isbn) != current_isbn_norm][:history_limit]
     return jsonify({"current": current_book, "history": history}), 200
 
 
@@ -1074,21 +1330,15 @@ def set_current_reading(user_id):
         )
         db.session.add(book)
 
-    if not any(b.isbn == isbn for b in user.library_books):
-        user.library_books.append(book)
-
+    add_to_library(user.id, isbn)
     user.current_reading_isbn = isbn
     db.session.commit()
 
     # History sin el libro actual para no repetirlo
-    history = [
-        b.serialize()
-        for b in user.library_books
-        if normalize_isbn(b.isbn) != normalize_isbn(isbn)
-    ]
+    current_book, history = serialize_current_reading(user)
     return jsonify(
         {
-            "current": book.serialize(),
+            "current": current_book,
             "history": history,
         }
     ), 200
@@ -1105,9 +1355,7 @@ def clear_current_reading(user_id):
 
     if isbn and user.current_reading_isbn and normalize_isbn(user.current_reading_isbn) != isbn:
         # Si se pasa un isbn distinto al current, simplemente lo quitamos de la librería
-        book = next((b for b in user.library_books if b.isbn == isbn), None)
-        if book:
-            user.library_books.remove(book)
+        remove_from_library(user.id, isbn)
         db.session.commit()
         return jsonify({"msg": "Book removed from library"}), 200
 
@@ -1118,25 +1366,41 @@ def clear_current_reading(user_id):
     return jsonify({"msg": "Current reading cleared"}), 200
 
 
-@api.route("/users/<int:user_id>/top3", methods=["GET"])
-def get_user_top3(user_id):
-    user = User.query.get(user_id)
-    if not user:
-        return jsonify({"msg": "User not found"}), 404
+def serialize_top3(pairs):
+    """[(position, Book), ...] -> lista de 3 huecos (libro serializado o None)."""
+    # positions 1, 2, 3 -> indices 0, 1, 2
+    top3 = [None, None, None]
+    for position, book in pairs:
+        if book is not None and position and 1 <= position <= 3:
+            top3[position - 1] = book.serialize()
+    return top3
 
+
+def load_user_with_top3(user_id, *options):
+    """
+    Carga el usuario y su Top 3 en una sola consulta (user LEFT JOIN user_top3 LEFT JOIN book).
+    options permite añadir eager loads del usuario (p. ej. selectinload(User.events)).
+    Devuelve (None, None) si el usuario no existe.
+    """
     rows = (
-        UserTop3.query.filter_by(user_id=user_id)
-        .order_by(UserTop3.position)
+        db.session.query(User, UserTop3.position, Book)
+        .options(*options)
+        .outerjoin(UserTop3, UserTop3.user_id == User.id)
+        .outerjoin(Book, Book.isbn == UserTop3.book_isbn)
+        .filter(User.id == user_id)
         .all()
     )
-    # positions 1, 2, 3 -> indices 0, 1, 2
-    result = [None, None, None]
-    for row in rows:
-        if 1 <= row.position <= 3 and row.book_isbn:
-            book = Book.query.get(row.book_isbn)
-            if book:
-                result[row.position - 1] = book.serialize()
-    return jsonify({"top3": result}), 200
+    if not rows:
+        return None, None
+    return rows[0][0], serialize_top3((position, book) for _, position, book in rows)
+
+
+@api.route("/users/<int:user_id>/top3", methods=["GET"])
+def get_user_top3(user_id):
+    user, top3 = load_user_with_top3(user_id)
+    if not user:
+        return jsonify({"msg": "User not found"}), 404
+    return jsonify({"top3": top3}), 200
 
 
 @api.route("/users/<int:user_id>/top3", methods=["PUT"])
@@ -1162,9 +1426,13 @@ def set_user_top3(user_id):
     if len(isbns) != len(set(isbns)):
         return jsonify({"msg": "Duplicate books are not allowed in Top 3"}), 400
 
+    # Todos los libros ya existentes en una sola consulta
+    books = {b.isbn: b for b in Book.query.filter(Book.isbn.in_(isbns)).all()} if isbns else {}
+
     # Remove existing top3 rows for this user
     UserTop3.query.filter_by(user_id=user_id).delete()
 
+    written = []
     for pos, slot in enumerate(slots, start=1):
         if slot is None:
             continue
@@ -1175,7 +1443,7 @@ def set_user_top3(user_id):
             continue
         if isinstance(authors, str):
             authors = [authors]
-        book = Book.query.get(isbn)
+        book = books.get(isbn)
         if not book:
             book = Book(
                 isbn=isbn,
@@ -1187,42 +1455,22 @@ def set_user_top3(user_id):
             db.session.add(book)
         row = UserTop3(user_id=user_id, position=pos, book_isbn=isbn)
         db.session.add(row)
+        written.append((pos, book))
 
+    # La respuesta sale de lo que acabamos de escribir: serializar antes del commit
+    # evita que SQLAlchemy recargue cada libro (expire_on_commit) o volver a consultar.
+    result = serialize_top3(written)
     db.session.commit()
-
-    rows = (
-        UserTop3.query.filter_by(user_id=user_id)
-        .order_by(UserTop3.position)
-        .all()
-    )
-    result = [None, None, None]
-    for row in rows:
-        if 1 <= row.position <= 3 and row.book_isbn:
-            book = Book.query.get(row.book_isbn)
-            if book:
-                result[row.position - 1] = book.serialize()
     return jsonify({"top3": result}), 200
 
 
 @api.route("/users/<int:user_id>/profile", methods=["GET"])
 def get_user_profile(user_id):
     """Devuelve perfil del usuario: aboutText, favoriteGenres, top3 (todo lo que antes era profile_prefs)."""
-    user = User.query.get(user_id)
+    user, top3 = load_user_with_top3(user_id)
     if not user:
         return jsonify({"msg": "User not found"}), 404
 
-    rows = (
-        UserTop3.query.filter_by(user_id=user_id)
-        .order_by(UserTop3.position)
-        .all()
-    )
-    top3 = [None, None, None]
-    for row in rows:
-        if 1 <= row.position <= 3 and row.book_isbn:
-            book = Book.query.get(row.book_isbn)
-            if book:
-                top3[row.position - 1] = book.serialize()
-
     genres = user.get_favorite_genres_list()
     return jsonify({
         "aboutText": user.about_text or "",
@@ -1231,6 +1479,41 @@ def get_user_profile(user_id):
     }), 200
 
 
+@api.route("/me/dashboard", methods=["GET"])
+@require_auth
+def get_my_dashboard():
+    """
+    Todo lo que necesita la Home al arrancar en una sola petición: usuario, lectura actual,
+    historial, Top 3, perfil y eventos. Se resuelve con un número fijo de consultas
+    (usuario + Top 3, librería, eventos) y soporta ETag: si nada cambió devuelve 304.
+    """
+    user_id = g.user_id
+
+    user, top3 = load_user_with_top3(
+        int(user_id),
+        selectinload(User.library_books),
+        selectinload(User.events),
+    )
+    if not user:
+        return jsonify({"message": "User not found"}), 404
+
+    current_book, history = serialize_current_reading(user)
+    response = jsonify({
+        "user": user.serialize(),
+        "current": current_book,
+        "history": history,
+        "top3": top3,
+        "profile": {
+            "aboutText": user.about_text or "",
+            "favoriteGenres": user.get_favorite_genres_list(),
+        },
+        "events": [event.serialize() for event in user.events],
+    })
+    response.add_etag()
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
+
+
 @api.route("/users/<int:user_id>/profile", methods=["PUT"])
 def set_user_profile(user_id):
     """Actualiza aboutText y/o favoriteGenres del usuario."""
@@ -1256,7 +1539,28 @@ def set_user_profile(user_id):
     }), 200
 
 
+def _sse_response(events, headers=None):
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+            'Connection': 'keep-alive',
+            **(headers or {}),
+        }
+    )
+
+
+def _replay_chunks(chunks):
+    """Reenvía una respuesta cacheada con los mismos eventos SSE que una generación real."""
+    for text in chunks:
+        yield f"data: {json.dumps({'content': text})}\n\n"
+    yield "data: [DONE]\n\n"
+
+
 @api.route("/ai-chat", methods=["POST"])
+@require_auth
 def ai_chat():
     """
     Endpoint principal del Chat de IA.
@@ -1273,32 +1577,41 @@ def ai_chat():
     - El componente AIChat.jsx abre una petición fetch a /api/ai-chat.
     - Va leyendo cada "chunk" y actualizando el mensaje del asistente en tiempo real.
     """
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return jsonify({"message": "Missing or invalid Authorization header"}), 401
-
-    token = auth_header.split(" ")[1]
-    user_id = verify_token(token)
+    user_id = g.user_id
 
-    if not user_id:
-        return jsonify({"message": "Invalid or expired token"}), 401
+    max_body = int(os.getenv("AI_CHAT_MAX_BODY_BYTES", str(256 * 1024)))
+    if request.content_length and request.content_length > max_body:
+        return jsonify({"message": "Request too large"}), 413
 
     data = request.get_json() or {}
     user_message = data.get("message", "").strip()
 
     if not user_message:
         return jsonify({"message": "Message is required"}), 400
+    if len(user_message) > int(os.getenv("AI_CHAT_MAX_MESSAGE_CHARS", "4000")):
+        return jsonify({"message": "Message is too long"}), 400
 
     gemini_api_key = os.getenv("GEMINI_API_KEY")
     if not gemini_api_key:
         return jsonify({"message": "GEMINI_API_KEY not configured"}), 500
 
-    try:
-        import google.generativeai as genai
-        genai.configure(api_key=gemini_api_key)
+    conversation_history = data.get("history", [])
 
-        conversation_history = data.get("history", [])
+    # Preguntas repetidas (misma pregunta normalizada y mismo final de historial)
+    response_cache = get_ai_response_cache()
+    cached_chunks = response_cache.get(user_message, conversation_history)
+    if cached_chunks is not None:
+        return _sse_response(_replay_chunks(cached_chunks), {"X-Cache": "HIT"})
 
+    # Hueco en el límite de streams simultáneos (global y por usuario); puede esperar en cola
+    try:
+        slot = get_stream_limiter().acquire(user_id)
+    except StreamRejected as e:
+        return jsonify({"message": e.message, "error": "too_many_streams"}), e.status_code
+
+    started = time.perf_counter()
+    streaming = False
+    try:
         system_prompt = """Eres un asistente virtual especializado en recomendar libros. 
         Tu objetivo es ayudar a los usuarios a encontrar libros que disfruten basándote en sus preferencias, 
         géneros favoritos, estados de ánimo, o cualquier otra información que compartan.
@@ -1308,83 +1621,71 @@ def ai_chat():
         
         Responde siempre en español y de forma conversacional."""
 
-        conversation_text = system_prompt + "\n\n"
-
-        for msg in conversation_history:
-            role = "Usuario" if msg.get("role") == "user" else "Asistente"
-            conversation_text += f"{role}: {msg.get('content', '')}\n\n"
-
-        conversation_text += f"Usuario: {user_message}\n\nAsistente:"
-
-        try:
-            available_models = genai.list_models()
-            model_name = None
-
-            for m in available_models:
-                if 'generateContent' in m.supported_generation_methods:
-                    if 'gemini' in m.name.lower():
-                        model_name = m.name
-                        break
-
-            if model_name is None:
-                for m in available_models:
-                    if 'generateContent' in m.supported_generation_methods:
-                        model_name = m.name
-                        break
-
-            if model_name is None:
-                available_names = [m.name for m in available_models]
-                raise Exception(f"No se encontró ningún modelo disponible que soporte generateContent. Modelos disponibles: {available_names}")
-
-            model = genai.GenerativeModel(model_name)
-
-        except Exception as list_error:
-            model_names = ['gemini-pro', 'gemini-1.0-pro', 'gemini-1.5-pro']
-            model = None
-            last_error = str(list_error)
-
-            for model_name in model_names:
-                try:
-                    model = genai.GenerativeModel(model_name)
-                    break
-                except Exception as e:
-                    last_error = str(e)
-                    continue
-
-            if model is None:
-                raise Exception(f"No se pudo inicializar ningún modelo. Error al listar: {str(list_error)}. Errores al probar modelos: {last_error}")
+        # Historial acotado por presupuesto de tokens (ver chat_history.py)
+        conversation_text, prompt_info = build_prompt(system_prompt, conversation_history, user_message)
 
         try:
+            model = gemini_client.get_model(gemini_api_key)
             response = model.generate_content(
                 conversation_text,
                 stream=True,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.7,
-                    max_output_tokens=2048,
-                )
+                generation_config=gemini_client.generation_config(),
             )
+        except ImportError:
+            raise  # lo gestiona el except ImportError de abajo
         except Exception as e:
+            gemini_client.record_request(None, (time.perf_counter() - started) * 1000, error=True)
             return jsonify({"message": f"Error generating response: {str(e)}"}), 500
 
         def generate():
+            first_token_ms = None
+            outcome = "cancelled"  # si el cliente se va, el servidor cierra el generador en un yield
+            chunks = []
+            upstream = relay(response, lambda: gemini_client.cancel_stream(response), heartbeat_seconds())
             try:
-                for chunk in response:
-                    if hasattr(chunk, 'text') and chunk.text:
-                        yield f"data: {json.dumps({'content': chunk.text})}\n\n"
+                for chunk in upstream:
+                    if chunk is None:
+                        # Comentario SSE: el frontend lo ignora, pero mantiene viva la conexión
+                        get_stream_limiter().record_heartbeat()
+                        event = ": keep-alive\n\n"
+                    elif hasattr(chunk, 'text') and chunk.text:
+                        if first_token_ms is None:
+                            first_token_ms = (time.perf_counter() - started) * 1000
+                        chunks.append(chunk.text)
+                        event = f"data: {json.dumps({'content': chunk.text})}\n\n"
+                    else:
+                        continue
+                    slot.add_bytes(len(event.encode()))
+                    yield event
+                outcome = "completed"
                 yield "data: [DONE]\n\n"
             except Exception as e:
+                outcome = "failed"
                 yield f"data: {json.dumps({'error': str(e)})}\n\n"
                 yield "data: [DONE]\n\n"
-
-        return Response(
-            stream_with_context(generate()),
-            mimetype='text/event-stream',
-            headers={
-                'Cache-Control': 'no-cache',
-                'X-Accel-Buffering': 'no',
-                'Connection': 'keep-alive'
-            }
-        )
+            finally:
+                upstream.close()
+                slot.release(outcome)
+                gemini_client.record_request(
+                    first_token_ms, (time.perf_counter() - started) * 1000, error=outcome == "failed"
+                )
+            # Solo se cachean respuestas completas (no si falló o el cliente cortó antes)
+            if chunks and outcome == "completed":
+                response_cache.set(user_message, conversation_history, chunks)
+
+        def on_close():
+            # El cliente se fue antes de que empezara el generador: no queda nadie leyendo
+            if not slot.released:
+                gemini_client.cancel_stream(response)
+                slot.release("cancelled")
+
+        streaming = True
+        sse = _sse_response(generate(), {
+            'X-Prompt-Tokens': str(prompt_info["prompt_tokens"]),
+            'X-Cache': 'MISS',
+        })
+        sse.call_on_close(on_close)
+        return sse
 
     except ImportError:
         return jsonify({
@@ -1394,17 +1695,22 @@ def ai_chat():
     except Exception as e:
         return jsonify({"message": f"Error in AI chat: {str(e)}"}), 500
 
+    finally:
+        if not streaming:
+            slot.release("failed")
+
 
 @api.route("/ai-chat/random-book", methods=["GET"])
+@require_auth
 def get_random_book():
     """
     Endpoint de apoyo al Chat de IA para la función "Sorpréndeme".
 
     Qué hace:
     - Requiere Authorization: Bearer <access_token>.
-    - Elige aleatoriamente un término de búsqueda de libros (novela, fantasía, etc.).
-    - Llama a la API de Google Books con ese término.
-    - Escoge un libro al azar entre los resultados.
+    - Saca un libro al azar de la reserva en memoria (random_book_pool.py), que se
+      rellena en segundo plano con búsquedas de Google Books por término
+      (novela, fantasía, etc.). Solo en frío espera a Google.
     - Devuelve un JSON con información rica del libro (título, autores, descripción,
       categorías, páginas, idioma, enlaces para más info y posible compra).
 
@@ -1412,98 +1718,25 @@ def get_random_book():
     - AIChat.jsx llama a /api/ai-chat/random-book cuando pulsas "🎲 Sorpréndeme".
     - Con la respuesta construye un mensaje formateado que el usuario ve en el chat.
     """
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return jsonify({"message": "Missing or invalid Authorization header"}), 401
-
-    token = auth_header.split(" ")[1]
-    user_id = verify_token(token)
 
-    if not user_id:
-        return jsonify({"message": "Invalid or expired token"}), 401
-
-    search_terms = [
-        "best seller", "novela", "ciencia ficción", "fantasía", "misterio",
-        "romance", "historia", "biografía", "aventura", "thriller",
-        "literatura", "clásico", "contemporáneo", "drama", "comedia"
-    ]
+    try:
+        book_data = get_random_book_pool().pop()
 
-    search_term = random.choice(search_terms)
+        if not book_data:
+            return jsonify({"message": "No books found"}), 404
 
-    url = "https://www.googleapis.com/books/v1/volumes"
-    params = {
-        "q": search_term,
-        "maxResults": 40,
-        "langRestrict": "es",
-        "printType": "books",
-        "orderBy": "relevance"
-    }
-    google_books_api_key = os.getenv("GOOGLE_BOOKS_API_KEY")
-    if google_books_api_key:
-        params["key"] = google_books_api_key
+        return jsonify(book_data), 200
 
-    try:
-        r = requests.get(
-            url,
-            params=params,
-            timeout=10,
-            headers={"User-Agent": "Mozilla/5.0"}
-        )
-        if r.status_code == 429:
+    except GoogleBooksError as e:
+        if e.status_code == 429:
             return jsonify({
                 "message": "Se ha excedido el límite de búsquedas. Intenta de nuevo en unos minutos.",
                 "error": "rate_limit"
             }), 429
-
-        if r.status_code != 200:
-            return jsonify({
-                "message": "Error fetching books from Google Books",
-                "status_code": r.status_code
-            }), 502
-
-        data = r.json()
-        items = data.get("items", []) or []
-
-        if not items:
-            return jsonify({"message": "No books found"}), 404
-
-        random_item = random.choice(items)
-        vi = random_item.get("volumeInfo", {}) or {}
-        img = (vi.get("imageLinks", {}) or {})
-        sale_info = (random_item.get("saleInfo", {}) or {})
-
-        isbn = None
-        identifiers = vi.get("industryIdentifiers", []) or []
-        for ident in identifiers:
-            if ident.get("type") in ["ISBN_13", "ISBN_10"]:
-                isbn = ident.get("identifier")
-                break
-            if not isbn:
-                for ident in identifiers:
-                    if "ISBN" in (ident.get("type", "") or ""):
-                        isbn = ident.get("identifier")
-                        break
-
-        # Enlaces útiles
-        google_books_url = vi.get("infoLink") or vi.get("previewLink") or vi.get("canonicalVolumeLink")
-        buy_link = sale_info.get("buyLink")
-
-        book_data = {
-            "id": random_item.get("id"),
-            "title": vi.get("title"),
-            "authors": vi.get("authors", []),
-            "publishedDate": vi.get("publishedDate"),
-            "thumbnail": img.get("thumbnail") or img.get("smallThumbnail"),
-            "isbn": isbn,
-            "description": vi.get("description", ""),
-            "categories": vi.get("categories", []),
-            "pageCount": vi.get("pageCount"),
-            "language": vi.get("language"),
-            "googleBooksUrl": google_books_url,
-            "buyLink": buy_link,
-        }
-
-        return jsonify(book_data), 200
+        return jsonify({
+            "message": "Error fetching books from Google Books",
+            "status_code": e.status_code
+        }), 502
 
     except requests.RequestException as e:
         return jsonify({
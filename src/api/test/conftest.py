@@ -0,0 +1,46 @@
+import os
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import event
+
+# Antes de importar la app: BD en memoria y sin hilos en segundo plano
+os.environ["DATABASE_URL"] = "sqlite://"
+os.environ.setdefault("FLASK_SECRET_KEY", "test-secret-key-with-at-least-32-bytes")
+os.environ["STREAM_SYNC_WORKER"] = "off"
+
+
+@pytest.fixture
+def app():
+    from app import app as flask_app
+    from api.models import db
+    flask_app.config["TESTING"] = True
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def count_queries(app):
+    """Context manager que cuenta las sentencias SQL ejecutadas dentro: with count_queries() as queries: ..."""
+    from api.models import db
+
+    @contextmanager
+    def counter():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+    return counter
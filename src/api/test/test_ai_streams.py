@@ -0,0 +1,75 @@
+import threading
+import pytest
+from api.utils_scripts import ai_streams
+from api.utils_scripts.ai_streams import StreamLimiter, StreamRejected, relay
+
+
+def test_per_user_limit_rejects_with_429():
+    limiter = StreamLimiter(max_streams=5, max_per_user=1, queue_timeout=0.05)
+    slot = limiter.acquire("u1")
+    with pytest.raises(StreamRejected) as excinfo:
+        limiter.acquire("u1")
+    assert excinfo.value.status_code == 429
+    other = limiter.acquire("u2")  # otro usuario sí entra
+    slot.release()
+    slot.release()  # idempotente
+    limiter.acquire("u1").release()
+    other.release("cancelled")
+    stats = limiter.stats()
+    assert stats["active_streams"] == 0
+    assert stats["completed"] == 2 and stats["cancelled"] == 1 and stats["rejected"] == 1
+
+
+def test_global_limit_rejects_with_503_when_queue_is_full():
+    limiter = StreamLimiter(max_streams=1, max_per_user=1, queue_size=0, queue_timeout=1)
+    limiter.acquire("u1")
+    with pytest.raises(StreamRejected) as excinfo:
+        limiter.acquire("u2")
+    assert excinfo.value.status_code == 503
+
+
+def test_queued_request_gets_slot_when_released():
+    limiter = StreamLimiter(max_streams=1, max_per_user=1, queue_timeout=5)
+    slot = limiter.acquire("u1")
+    threading.Timer(0.05, slot.release).start()
+    limiter.acquire("u2").release()
+    assert limiter.stats()["queued"] == 1
+
+
+def test_relay_yields_chunks_and_heartbeats():
+    ready = threading.Event()
+
+    def chunks():
+        ready.wait(5)
+        yield "a"
+        yield "b"
+
+    out = []
+    for item in relay(chunks(), cancel=lambda: None, heartbeat_seconds=0.02):
+        out.append(item)
+        if item is None:
+            ready.set()
+    assert out[0] is None
+    assert [i for i in out if i is not None] == ["a", "b"]
+
+
+def test_relay_cancels_when_closed_early():
+    cancelled = []
+    gen = relay(iter(["a", "b", "c"]), cancel=lambda: cancelled.append(True), heartbeat_seconds=1)
+    assert next(gen) == "a"
+    gen.close()
+    assert cancelled == [True]
+
+
+def test_deployment_stream_caps_are_split_between_workers(monkeypatch):
+    monkeypatch.delenv("AI_CHAT_MAX_STREAMS", raising=False)
+    monkeypatch.delenv("AI_CHAT_STREAM_QUEUE_SIZE", raising=False)
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    monkeypatch.setenv("AI_CHAT_MAX_STREAMS_TOTAL", "20")
+    monkeypatch.setattr(ai_streams, "_limiter", None)
+    stats = ai_streams.get_stream_limiter().stats()
+    assert stats["max_streams"] == 5
+    assert stats["queue_size"] == 12
+    monkeypatch.setenv("AI_CHAT_MAX_STREAMS", "7")
+    monkeypatch.setattr(ai_streams, "_limiter", None)
+    assert ai_streams.get_stream_limiter().stats()["max_streams"] == 7
@@ -0,0 +1,54 @@
+import pytest
+from api.models import db, User
+from api.utils_scripts.auth_utils import create_refresh_token, create_token
+
+
+@pytest.fixture
+def user_id(app):
+    user = User(email="reader@example.com", username="reader", password="x", is_active=True)
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+def bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_access_token_is_accepted(client, user_id):
+    response = client.get("/api/me", headers=bearer(create_token(user_id)))
+    assert response.status_code == 200
+    assert response.json["id"] == str(user_id)
+
+
+def test_refresh_token_is_rejected_as_bearer(client, user_id):
+    response = client.get("/api/me", headers=bearer(create_refresh_token(user_id)))
+    assert response.status_code == 401
+
+
+def test_missing_or_garbage_token(client):
+    assert client.get("/api/me").status_code == 401
+    assert client.get("/api/me", headers=bearer("not-a-jwt")).status_code == 401
+
+
+@pytest.fixture
+def event_id(app):
+    from datetime import date, time
+    from api.models import Event
+    event = Event(title="Club", date=date(2030, 1, 1), time=time(19, 0), category="club", location="Madrid")
+    db.session.add(event)
+    db.session.commit()
+    return event.id
+
+
+def test_delete_event_requires_access_token(client, user_id, event_id):
+    assert client.delete(f"/api/events/{event_id}").status_code == 401
+    assert client.delete(f"/api/events/{event_id}", headers=bearer(create_refresh_token(user_id))).status_code == 401
+    assert client.delete(f"/api/events/{event_id}", headers=bearer(create_token(user_id))).status_code == 200
+
+
+def test_event_signup_uses_token_user(client, user_id, event_id):
+    assert client.post(f"/api/events/{event_id}/signup").status_code == 400
+    assert client.post(f"/api/events/{event_id}/signup", headers=bearer(create_refresh_token(user_id))).status_code == 400
+    assert client.post(f"/api/events/{event_id}/signup", headers=bearer(create_token(user_id))).status_code == 200
+    assert client.delete(f"/api/events/{event_id}/signup", headers=bearer(create_token(user_id))).status_code == 200
@@ -0,0 +1,64 @@
+from api.utils_scripts.books_cache import MISSING, LRUCache, SQLiteCache, TieredCache, search_cache_key
+
+
+def test_search_cache_key_normalizes_case_and_spaces():
+    assert search_cache_key("  Dune   Messiah ", "es") == search_cache_key("dune messiah", "es")
+    assert search_cache_key("Dune", "es") != search_cache_key("Dune", "en")
+    assert search_cache_key(None, None) == "search::"
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1, 60)
+    cache.set("b", 2, 60)
+    assert cache.get("a") == 1  # "b" pasa a ser el menos usado
+    cache.set("c", 3, 60)
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_expires_entries():
+    cache = LRUCache()
+    cache.set("a", 1, 0)
+    assert cache.get("a") is MISSING
+    assert cache.stats()["size"] == 0
+
+
+def test_sqlite_cache_expiry_and_remaining_ttl(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.db"))
+    cache.set("fresh", {"items": [1]}, 60)
+    cache.set("stale", {"items": [2]}, -1)
+    value, remaining = cache.get_with_ttl("fresh")
+    assert value == {"items": [1]} and 0 < remaining <= 60
+    assert cache.get("stale") is MISSING
+    cache.purge_expired()
+    assert cache._connect().execute("SELECT COUNT(*) FROM books_cache").fetchone()[0] == 1
+
+
+def test_tiered_cache_promotes_shared_hits_to_memory(tmp_path):
+    shared = SQLiteCache(str(tmp_path / "cache.db"))
+    shared.set("k", [1, 2], 60)
+    local = LRUCache()
+    cache = TieredCache(local, shared=shared)
+    assert cache.get("k") == [1, 2]
+    assert local.get("k") == [1, 2]
+
+
+def test_sqlite_cache_purges_on_write_and_caps_rows(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.db"), max_rows=3, purge_interval=0)
+    cache.set("stale", 1, -1)
+    for i in range(5):
+        cache.set(f"k{i}", i, 60 + i)
+    keys = [row[0] for row in cache._connect().execute("SELECT key FROM books_cache ORDER BY key")]
+    # Sobreviven las 3 que más tarde caducan
+    assert keys == ["k2", "k3", "k4"]
+    assert cache.stats()["purged"] == 3
+
+
+def test_sqlite_cache_purge_is_throttled(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.db"), max_rows=1, purge_interval=3600)
+    for i in range(3):
+        cache.set(f"k{i}", i, 60)
+    # Solo la primera escritura purga; hasta que pase el intervalo se acumulan
+    assert cache._connect().execute("SELECT COUNT(*) FROM books_cache").fetchone()[0] == 3
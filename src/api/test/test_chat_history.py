@@ -0,0 +1,53 @@
+import pytest
+from api.utils_scripts.chat_history import build_prompt, estimate_tokens
+
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    monkeypatch.setenv("AI_CHAT_HISTORY_TOKEN_BUDGET", "200")
+    monkeypatch.setenv("AI_CHAT_KEEP_MESSAGES", "2")
+    monkeypatch.setenv("AI_CHAT_MAX_HISTORY_MESSAGES", "50")
+    monkeypatch.setenv("AI_CHAT_MAX_MESSAGE_CHARS", "4000")
+
+
+def conversation(n, text="Mensaje número {i}. Con una segunda frase que no va al resumen."):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": text.format(i=i)} for i in range(n)]
+
+
+def test_without_history():
+    prompt, info = build_prompt("Eres Bookie.", [], "Hola")
+    assert prompt == "Eres Bookie.\n\nUsuario: Hola\n\nAsistente:"
+    assert info["history_messages"] == 0 and info["prompt_tokens"] == estimate_tokens(prompt)
+
+
+def test_recent_messages_literal_and_older_summarized():
+    prompt, info = build_prompt("Sistema", conversation(4), "¿Y ahora?")
+    assert info["kept"] == 2 and info["summarized"] == 2 and info["dropped"] == 0
+    assert "Usuario: Mensaje número 2. Con una segunda frase" in prompt
+    assert "- Usuario: Mensaje número 0.\n" in prompt
+    assert "Mensaje número 0. Con una segunda" not in prompt
+
+
+def test_history_stays_within_budget():
+    _, info = build_prompt("Sistema", conversation(200), "Pregunta")
+    assert info["history_messages"] == 50
+    assert info["kept"] + info["summarized"] + info["dropped"] == 50
+    assert info["dropped"] > 0
+    # presupuesto + mensaje actual + cabecera del resumen y separadores
+    overhead = estimate_tokens("Sistema\n\nUsuario: Pregunta\n\nAsistente:\n\nResumen de la conversación anterior:\n")
+    assert info["prompt_tokens"] <= 200 + overhead + info["kept"] + info["summarized"]
+
+
+def test_oversized_last_message_is_truncated_to_budget():
+    history = [{"role": "user", "content": "x" * 3000}]
+    prompt, info = build_prompt("Sistema", history, "Pregunta")
+    assert info["kept"] == 1
+    assert "x" * 900 not in prompt
+    assert "…" in prompt
+
+
+def test_invalid_entries_are_ignored():
+    history = [None, {"role": "user"}, {"role": "user", "content": "   "}, {"role": "x", "content": "hola"}]
+    prompt, info = build_prompt("Sistema", history, "Pregunta")
+    assert info["history_messages"] == 1
+    assert "Asistente: hola" in prompt
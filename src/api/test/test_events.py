@@ -0,0 +1,60 @@
+import pytest
+from api.utils_scripts.pagination import encode_cursor
+
+
+@pytest.mark.parametrize("cursor", [
+    "WzEsMiwzXQ",  # [1, 2, 3]
+    encode_cursor(["2026-10-18", "19:30:00"]),
+    encode_cursor(["2026-10-18", "7pm", 1]),
+    "not-a-cursor",
+])
+def test_invalid_cursor_is_a_400(client, cursor):
+    response = client.get(f"/api/events?cursor={cursor}")
+    assert response.status_code == 400
+
+
+@pytest.fixture
+def events(app):
+    from datetime import datetime, time, timedelta
+    from api.models import db, Event
+    # La ruta filtra "próximos" con la fecha UTC, no la local
+    today = datetime.utcnow().date()
+    start = today + timedelta(days=1)
+    for i in range(120):
+        db.session.add(Event(title=f"Evento {i}", date=start + timedelta(days=i), time=time(19, 0),
+                             category="club", location="Madrid"))
+    db.session.add(Event(title="Pasado", date=today - timedelta(days=3), time=time(10, 0),
+                         category="club", location="Madrid"))
+    db.session.commit()
+
+
+def test_without_limit_returns_every_upcoming_event(client, events):
+    response = client.get("/api/events")
+    assert response.status_code == 200
+    assert len(response.json) == 120
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_pages_with_limit_and_cursor(client, events):
+    titles = []
+    response = client.get("/api/events?limit=50")
+    while True:
+        titles.extend(e["title"] for e in response.json)
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+        response = client.get(f"/api/events?limit=50&cursor={cursor}")
+    assert titles == [f"Evento {i}" for i in range(120)]
+    assert len(client.get("/api/events?upcoming=0").json) == 121
+
+
+@pytest.mark.parametrize("query, message", [
+    ("lng=-3.7", "lat and lng are required numbers"),
+    ("lat=x&lng=-3.7", "lat and lng are required numbers"),
+    ("lat=40.4&lng=-3.7&radius_km=far", "radius_km must be a number"),
+    ("lat=40.4&lng=-3.7&limit=ten", "limit must be an integer"),
+])
+def test_nearby_reports_which_param_is_invalid(client, query, message):
+    response = client.get(f"/api/events/nearby?{query}")
+    assert response.status_code == 400
+    assert response.json["msg"] == message
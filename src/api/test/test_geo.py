@@ -0,0 +1,38 @@
+import math
+import pytest
+from api.utils_scripts.geo import covering_cells, encode_geohash, haversine_km, prefix_range
+
+
+def test_encode_geohash_known_value():
+    assert encode_geohash(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert encode_geohash(57.64911, 10.40744, 5) == "u4pru"
+
+
+@pytest.mark.parametrize("lat, lng", [
+    (40.4168, -3.7038),   # Madrid
+    (0.0, 0.0),           # borde de las cuatro celdas raíz
+    (45.0, 179.999),      # antimeridiano
+    (-33.8688, 151.2093),
+])
+def test_covering_cells_contain_every_point_of_the_circle(lat, lng):
+    radius_km = 5
+    cells = covering_cells(lat, lng, radius_km)
+    precision = len(next(iter(cells)))
+    # Puntos en el borde del círculo (norte, sur, este, oeste y diagonales)
+    dlat = radius_km / 111.32
+    for mlat, mlng in [(1, 0), (-1, 0), (0, 1), (0, -1), (0.7, 0.7), (-0.7, -0.7)]:
+        p_lat = lat + mlat * dlat
+        p_lng = lng + mlng * dlat / math.cos(math.radians(p_lat))
+        p_lng = (p_lng + 180.0) % 360.0 - 180.0
+        assert haversine_km(lat, lng, p_lat, p_lng) <= radius_km * 1.01
+        assert encode_geohash(p_lat, p_lng, precision) in cells
+
+
+def test_covering_cells_gives_up_for_huge_radius():
+    assert covering_cells(40.0, -3.0, 20000) is None
+
+
+def test_prefix_range():
+    assert prefix_range("ezs4") == ("ezs4", "ezs5")
+    assert prefix_range("ezz") == ("ezz", "f")
+    assert prefix_range("zz") == ("zz", None)
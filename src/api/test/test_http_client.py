@@ -0,0 +1,52 @@
+import pytest
+import requests
+from api.utils_scripts.http_client import CircuitOpenError, PooledHttpClient
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {}
+
+
+def make_client(monkeypatch, outcomes, **kwargs):
+    """Cliente cuyo session.request devuelve (o lanza) cada elemento de outcomes por orden."""
+    client = PooledHttpClient("test", backoff_base=0, backoff_cap=0, **kwargs)
+    outcomes = iter(outcomes)
+
+    def fake_request(method, url, **_):
+        outcome = next(outcomes)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return FakeResponse(outcome)
+
+    monkeypatch.setattr(client.session, "request", fake_request)
+    return client
+
+
+def test_retries_of_one_request_count_as_one_failure(monkeypatch):
+    client = make_client(monkeypatch, [500, 500, 500], max_retries=2, failure_threshold=2)
+    assert client.request("GET", "http://x").status_code == 500
+    assert client.requests == 3
+    assert client.breaker.state() == "closed"
+
+
+def test_circuit_opens_after_threshold_failed_requests(monkeypatch):
+    errors = [requests.ConnectionError()] * 4
+    client = make_client(monkeypatch, errors, max_retries=1, failure_threshold=2)
+    for _ in range(2):
+        with pytest.raises(requests.ConnectionError):
+            client.request("GET", "http://x")
+    assert client.breaker.state() == "open"
+    with pytest.raises(CircuitOpenError):
+        client.request("GET", "http://x")
+
+
+def test_unexpected_error_releases_half_open_probe(monkeypatch):
+    client = make_client(monkeypatch, [RuntimeError("decode"), 200], max_retries=0, failure_threshold=1)
+    client.breaker._open_until = 1.0  # medio abierto: el cooldown ya pasó
+    with pytest.raises(RuntimeError):
+        client.request("GET", "http://x")
+    # La siguiente petición puede hacer de prueba y cierra el circuito
+    assert client.request("GET", "http://x").status_code == 200
+    assert client.breaker.state() == "closed"
@@ -0,0 +1,17 @@
+import pytest
+from api.utils_scripts import password_hashing
+
+
+def test_argon2_without_the_package_fails_clearly(monkeypatch):
+    monkeypatch.setattr(password_hashing, "argon2", None)
+    with pytest.raises(RuntimeError, match="argon2-cffi"):
+        password_hashing.make_hasher("argon2")
+
+
+def test_hashes_from_another_method_need_rehash():
+    old = password_hashing.make_hasher("pbkdf2:sha256:1000")
+    new = password_hashing.make_hasher("pbkdf2:sha256:2000")
+    stored = old.hash("secret")
+    assert password_hashing._check(stored, "secret")
+    assert not old.needs_rehash(stored)
+    assert new.needs_rehash(stored)
@@ -0,0 +1,78 @@
+import threading
+import time
+from api.utils_scripts.random_book_pool import RandomBookPool
+
+TERMS = [f"term{i}" for i in range(15)]
+
+
+class FakeFetch:
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, term):
+        with self._lock:
+            self.calls.append(term)
+        return [{"title": f"{term} {i}", "isbn": f"{term}-{i}"} for i in range(20)]
+
+
+def wait_for_refills(pool):
+    pool._executor.shutdown(wait=True)
+
+
+def test_cold_pop_fetches_a_single_term():
+    fetch = FakeFetch()
+    pool = RandomBookPool(TERMS, fetch=fetch, low_water=2)
+    book = pool.pop()
+    wait_for_refills(pool)
+    assert book is not None
+    assert len(fetch.calls) == 1
+    assert pool.stats()["cold_misses"] == 1
+
+
+def test_each_pop_schedules_at_most_one_new_term():
+    fetch = FakeFetch()
+    pool = RandomBookPool(TERMS, fetch=fetch, low_water=2)
+    pool.pop()
+    for _ in range(5):
+        assert pool.pop() is not None
+    wait_for_refills(pool)
+    # 1 carga en frío + como mucho un término nuevo por clic
+    assert len(fetch.calls) <= 6
+    assert len(set(fetch.calls)) == len(fetch.calls)
+
+
+def test_each_refill_is_persisted_once():
+    fetch = FakeFetch()
+    saved = []
+    pool = RandomBookPool(TERMS, fetch=fetch, persist=saved.append, low_water=2)
+    for _ in range(10):
+        assert pool.pop() is not None
+    wait_for_refills(pool)
+    assert len(saved) == len(fetch.calls)
+
+
+def test_cold_pops_wait_for_the_refill_in_flight():
+    release = threading.Event()
+
+    class SlowFetch(FakeFetch):
+        def __call__(self, term):
+            release.wait(5)
+            return super().__call__(term)
+
+    fetch = SlowFetch()
+    pool = RandomBookPool(TERMS, fetch=fetch, low_water=2)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(pool.pop())) for _ in range(4)]
+    for t in threads:
+        t.start()
+    while pool.stats()["cold_waits"] < 3:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+    wait_for_refills(pool)
+    assert all(book is not None for book in results)
+    # Una sola búsqueda en frío; el resto son recargas en segundo plano tras servir
+    assert fetch.calls.count(fetch.calls[0]) == 1
+    assert pool.stats()["cold_misses"] == 4
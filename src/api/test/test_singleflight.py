@@ -0,0 +1,40 @@
+import threading
+import pytest
+from api.utils_scripts.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", fetch))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    # Esperar a que todos estén dentro antes de dejar terminar al primero
+    while flight.stats()["collapsed"] < 4:
+        threading.Event().wait(0.01)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert calls == [1]
+    assert results == ["result"] * 5
+    assert flight.stats() == {"executed": 1, "collapsed": 4, "in_flight": 0}
+
+
+def test_errors_are_raised_and_key_is_released():
+    flight = SingleFlight()
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        flight.do("k", fail)
+    assert flight.do("k", lambda: 42) == 42
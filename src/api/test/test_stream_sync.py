@@ -0,0 +1,42 @@
+from api.models import db, User, StreamSyncJob
+from api.utils_scripts import stream_sync
+
+
+class OkClient:
+    def upsert_users(self, payloads):
+        pass
+
+
+class FailingClient:
+    def upsert_users(self, payloads):
+        raise RuntimeError("stream down")
+
+
+def test_failed_db_write_reschedules_jobs(app, monkeypatch):
+    user = User(email="a@example.com", username="a", password="x", is_active=True)
+    db.session.add(user)
+    db.session.commit()
+    stream_sync.enqueue_user_sync(user.id)
+
+    def broken_record_synced(payloads):
+        # Un flush fallido deja la sesión pendiente de rollback, como un error real de la BD
+        db.session.add(User(email="a@example.com", username="dup", password="x", is_active=True))
+        db.session.flush()
+
+    monkeypatch.setattr(stream_sync, "get_stream_client", OkClient)
+    monkeypatch.setattr(stream_sync, "record_synced", broken_record_synced)
+    assert stream_sync.process_pending() == 1
+
+    job = db.session.get(StreamSyncJob, user.id)
+    assert job.attempts == 1
+    assert "UNIQUE" in job.last_error
+
+
+def test_stream_failure_reschedules_jobs(app, monkeypatch):
+    user = User(email="b@example.com", username="b", password="x", is_active=True)
+    db.session.add(user)
+    db.session.commit()
+    stream_sync.enqueue_user_sync(user.id)
+    monkeypatch.setattr(stream_sync, "get_stream_client", FailingClient)
+    assert stream_sync.process_pending() == 1
+    assert db.session.get(StreamSyncJob, user.id).attempts == 1
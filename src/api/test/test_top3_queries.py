@@ -0,0 +1,53 @@
+"""Número fijo de consultas en Top 3 y perfil, tenga el usuario los libros que tenga (sin N+1)."""
+import pytest
+from api.models import db, User, Book, UserTop3
+
+TOP3 = [
+    {"isbn": "9780000000001", "title": "Uno", "authors": ["A"]},
+    {"isbn": "9780000000002", "title": "Dos", "authors": ["B"]},
+    {"isbn": "9780000000003", "title": "Tres", "authors": ["C"]},
+]
+
+
+@pytest.fixture
+def user_id(app):
+    user = User(email="reader@example.com", username="reader", password="x", is_active=True)
+    db.session.add(user)
+    db.session.flush()
+    for position, book in enumerate(TOP3, start=1):
+        db.session.add(Book(isbn=book["isbn"], title=book["title"], author=";".join(book["authors"])))
+        db.session.add(UserTop3(user_id=user.id, position=position, book_isbn=book["isbn"]))
+    db.session.commit()
+    user_id = user.id
+    db.session.expunge_all()  # que la petición no reutilice objetos ya cargados
+    return user_id
+
+
+def test_get_top3_uses_one_query(client, count_queries, user_id):
+    with count_queries() as queries:
+        response = client.get(f"/api/users/{user_id}/top3")
+    assert response.status_code == 200
+    assert [b["title"] for b in response.json["top3"]] == ["Uno", "Dos", "Tres"]
+    assert len(queries) == 1
+
+
+def test_get_profile_uses_one_query(client, count_queries, user_id):
+    with count_queries() as queries:
+        response = client.get(f"/api/users/{user_id}/profile")
+    assert response.status_code == 200
+    assert [b["isbn"] for b in response.json["top3"]] == [b["isbn"] for b in TOP3]
+    assert len(queries) == 1
+
+
+def test_put_top3_query_count_does_not_depend_on_slots(client, count_queries, user_id):
+    new_top3 = [
+        TOP3[2],
+        {"isbn": "9780000000004", "title": "Cuatro", "authors": ["D"]},
+        {"isbn": "9780000000005", "title": "Cinco", "authors": "E"},
+    ]
+    with count_queries() as queries:
+        response = client.put(f"/api/users/{user_id}/top3", json={"top3": new_top3})
+    assert response.status_code == 200
+    assert [b["title"] for b in response.json["top3"]] == ["Tres", "Cuatro", "Cinco"]
+    # usuario, libros existentes (IN), borrado del Top 3 anterior, INSERT de libros nuevos y de filas
+    assert len(queries) == 5
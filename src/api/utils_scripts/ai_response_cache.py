@@ -0,0 +1,167 @@
+"""
+Cache de respuestas de /ai-chat para preguntas repetidas.
+
+Clave: pregunta normalizada (minúsculas, sin tildes ni signos, espacios colapsados)
++ huella de los últimos AI_CACHE_HISTORY_MESSAGES mensajes del historial, para que la
+misma pregunta en conversaciones distintas no comparta respuesta.
+
+Además, con AI_CACHE_SIMILARITY_THRESHOLD (0-1, desactivado por defecto) se busca la
+pregunta más parecida con la misma huella de historial, comparando vectores de
+trigramas de caracteres (un "embedding" local, sin llamar a ningún servicio).
+
+Las respuestas se guardan como la lista de trozos que devolvió Gemini y se reenvían
+igual, como eventos SSE "data:". Memoria del proceso con TTL y expulsión LRU.
+"""
+import hashlib
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from api.utils_scripts.books_cache import MISSING, LRUCache
+
+_NON_WORD = re.compile(r"[^a-z0-9ñ ]+")
+
+
+def normalize_question(text):
+    text = unicodedata.normalize("NFD", (text or "").lower())
+    # Se conserva la ñ (n + tilde combinada) para no confundir "año" con "ano"
+    text = "".join(c for c in text if unicodedata.category(c) != "Mn" or c == "\u0303")
+    text = unicodedata.normalize("NFC", text)
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+
+def history_fingerprint(history, messages):
+    """Hash corto de los últimos mensajes del historial ('' si no hay historial)."""
+    if not isinstance(history, list) or messages <= 0:
+        return ""
+    tail = [
+        f"{m.get('role')}:{normalize_question(m.get('content'))}"
+        for m in history[-messages:]
+        if isinstance(m, dict) and isinstance(m.get("content"), str)
+    ]
+    if not tail:
+        return ""
+    return hashlib.sha1("\n".join(tail).encode()).hexdigest()[:16]
+
+
+def trigram_vector(text):
+    padded = f"  {text} "
+    return Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def cosine(a, b):
+    if not a or not b:
+        return 0.0
+    if len(a) > len(b):
+        a, b = b, a
+    dot = sum(n * b.get(g, 0) for g, n in a.items())
+    norm = math.sqrt(sum(n * n for n in a.values())) * math.sqrt(sum(n * n for n in b.values()))
+    return dot / norm if norm else 0.0
+
+
+class AIResponseCache:
+    def __init__(self, max_entries=500, ttl=3600, history_messages=2, similarity_threshold=0.0):
+        self.ttl = ttl
+        self.history_messages = history_messages
+        self.similarity_threshold = similarity_threshold
+        self._responses = LRUCache(max_entries=max_entries)
+        # clave -> (huella, vector) para la búsqueda por similitud; mismo tamaño máximo
+        self._index = OrderedDict()
+        self._index_lock = threading.Lock()
+        self.max_entries = max_entries
+        self._counters_lock = threading.Lock()
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def _count(self, name):
+        # Se llama desde varios hilos de peticiones a la vez
+        with self._counters_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def key_for(self, question, history):
+        fingerprint = history_fingerprint(history, self.history_messages)
+        return fingerprint, f"{fingerprint}:{normalize_question(question)}"
+
+    def get(self, question, history):
+        """Trozos de la respuesta guardada o None."""
+        fingerprint, key = self.key_for(question, history)
+        chunks = self._responses.get(key)
+        if chunks is not MISSING:
+            self._count("exact_hits")
+            return chunks
+        if self.similarity_threshold > 0:
+            chunks = self._get_similar(fingerprint, key)
+            if chunks is not None:
+                self._count("similar_hits")
+                return chunks
+        self._count("misses")
+        return None
+
+    def _get_similar(self, fingerprint, key):
+        vector = trigram_vector(key.split(":", 1)[1])
+        with self._index_lock:
+            candidates = [(k, v) for k, (fp, v) in self._index.items() if fp == fingerprint]
+        best_key, best_score = None, self.similarity_threshold
+        for candidate_key, candidate_vector in candidates:
+            score = cosine(vector, candidate_vector)
+            if score >= best_score:
+                best_key, best_score = candidate_key, score
+        if best_key is None:
+            return None
+        chunks = self._responses.get(best_key)
+        if chunks is MISSING:
+            with self._index_lock:
+                self._index.pop(best_key, None)
+            return None
+        return chunks
+
+    def set(self, question, history, chunks):
+        fingerprint, key = self.key_for(question, history)
+        self._responses.set(key, list(chunks), self.ttl)
+        self._count("stores")
+        if self.similarity_threshold > 0:
+            with self._index_lock:
+                self._index[key] = (fingerprint, trigram_vector(key.split(":", 1)[1]))
+                self._index.move_to_end(key)
+                while len(self._index) > self.max_entries:
+                    self._index.popitem(last=False)
+
+    def stats(self):
+        with self._counters_lock:
+            exact_hits, similar_hits = self.exact_hits, self.similar_hits
+            misses, stores = self.misses, self.stores
+        hits = exact_hits + similar_hits
+        lookups = hits + misses
+        return {
+            "ttl": self.ttl,
+            "similarity_threshold": self.similarity_threshold,
+            "exact_hits": exact_hits,
+            "similar_hits": similar_hits,
+            "misses": misses,
+            "stores": stores,
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+            "responses": self._responses.stats(),
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_ai_response_cache():
+    """Cache de respuestas de /ai-chat del proceso, creada la primera vez."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AIResponseCache(
+                    max_entries=int(os.getenv("AI_CACHE_MAX_ENTRIES", "500")),
+                    ttl=int(os.getenv("AI_CACHE_TTL", "3600")),
+                    history_messages=int(os.getenv("AI_CACHE_HISTORY_MESSAGES", "2")),
+                    similarity_threshold=float(os.getenv("AI_CACHE_SIMILARITY_THRESHOLD", "0")),
+                )
+    return _cache
@@ -0,0 +1,210 @@
+"""
+Streams SSE de /ai-chat: límites de concurrencia, heartbeats y cancelación.
+
+- StreamLimiter: como mucho AI_CHAT_MAX_STREAMS generaciones a la vez en el proceso
+  y AI_CHAT_MAX_STREAMS_PER_USER por usuario. Si no hay hueco la petición espera en
+  cola hasta AI_CHAT_STREAM_QUEUE_TIMEOUT segundos (con AI_CHAT_STREAM_QUEUE_SIZE
+  peticiones esperando como máximo) y después se rechaza con 429/503.
+  Los contadores son de cada worker de gunicorn, no compartidos. Por eso el límite
+  global se da para todo el despliegue (AI_CHAT_MAX_STREAMS_TOTAL, por defecto 20, y
+  AI_CHAT_STREAM_QUEUE_SIZE_TOTAL, por defecto 50) y cada worker se queda con su parte
+  según WEB_CONCURRENCY. AI_CHAT_MAX_STREAMS / AI_CHAT_STREAM_QUEUE_SIZE, si se dan,
+  fijan el valor por worker directamente. El límite por usuario también es por worker:
+  un usuario cuyas peticiones caigan en workers distintos puede llegar a
+  AI_CHAT_MAX_STREAMS_PER_USER × WEB_CONCURRENCY.
+- relay(): un hilo lee los trozos de Gemini y los deja en una cola acotada (si el
+  cliente lee despacio, el hilo se para en vez de acumular). Mientras no llega nada
+  se emite un heartbeat cada AI_CHAT_HEARTBEAT_SECONDS para que los proxies no
+  corten ni bufferen. Si el cliente se desconecta, el servidor WSGI cierra el
+  generador y se cancela la generación en Gemini.
+"""
+import os
+import queue
+import threading
+
+_END = object()
+
+
+class StreamRejected(Exception):
+    def __init__(self, status_code, message):
+        Exception.__init__(self, message)
+        self.status_code = status_code
+        self.message = message
+
+
+class StreamSlot:
+    """Hueco ocupado por un stream. release() es idempotente."""
+
+    def __init__(self, limiter, user_id):
+        self._limiter = limiter
+        self.user_id = user_id
+        self.released = False
+
+    def add_bytes(self, n):
+        self._limiter._add_bytes(n)
+
+    def release(self, outcome="completed"):
+        if not self.released:
+            self.released = True
+            self._limiter._release(self, outcome)
+
+
+class StreamLimiter:
+    def __init__(self, max_streams=20, max_per_user=2, queue_size=50, queue_timeout=10.0):
+        self.max_streams = max_streams
+        self.max_per_user = max_per_user
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._active = 0
+        self._per_user = {}
+        self._waiting = 0
+        self._counters = {
+            "started": 0, "completed": 0, "cancelled": 0, "failed": 0,
+            "rejected": 0, "queued": 0, "heartbeats": 0, "bytes_streamed": 0,
+        }
+
+    def _has_room(self, user_id):
+        return self._active < self.max_streams and self._per_user.get(user_id, 0) < self.max_per_user
+
+    def acquire(self, user_id):
+        """Devuelve un StreamSlot o lanza StreamRejected si no hay hueco a tiempo."""
+        with self._cond:
+            if not self._has_room(user_id):
+                if self._waiting >= self.queue_size:
+                    self._counters["rejected"] += 1
+                    raise StreamRejected(503, "El asistente está saturado. Inténtalo de nuevo en unos segundos.")
+                self._counters["queued"] += 1
+                self._waiting += 1
+                try:
+                    if not self._cond.wait_for(lambda: self._has_room(user_id), timeout=self.queue_timeout):
+                        self._counters["rejected"] += 1
+                        if self._per_user.get(user_id, 0) >= self.max_per_user:
+                            raise StreamRejected(429, "Ya tienes otra respuesta en curso. Espera a que termine.")
+                        raise StreamRejected(503, "El asistente está saturado. Inténtalo de nuevo en unos segundos.")
+                finally:
+                    self._waiting -= 1
+            self._active += 1
+            self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+            self._counters["started"] += 1
+            return StreamSlot(self, user_id)
+
+    def _release(self, slot, outcome):
+        with self._cond:
+            self._active -= 1
+            remaining = self._per_user.get(slot.user_id, 1) - 1
+            if remaining > 0:
+                self._per_user[slot.user_id] = remaining
+            else:
+                self._per_user.pop(slot.user_id, None)
+            self._counters[outcome] += 1
+            self._cond.notify_all()
+
+    def _add_bytes(self, n):
+        with self._cond:
+            self._counters["bytes_streamed"] += n
+
+    def record_heartbeat(self):
+        with self._cond:
+            self._counters["heartbeats"] += 1
+
+    def stats(self):
+        with self._cond:
+            return {
+                "active_streams": self._active,
+                "waiting": self._waiting,
+                "max_streams": self.max_streams,
+                "max_per_user": self.max_per_user,
+                "queue_size": self.queue_size,
+                **self._counters,
+            }
+
+
+def relay(chunks, cancel, heartbeat_seconds=15.0, buffer_size=32):
+    """
+    Itera chunks (el stream de Gemini) en un hilo aparte y devuelve sus elementos;
+    devuelve None cada heartbeat_seconds sin datos. Las excepciones del stream se
+    relanzan aquí. Al cerrar este generador antes de terminar se llama a cancel().
+    """
+    buffer = queue.Queue(maxsize=buffer_size)
+    stop = threading.Event()
+
+    def put(item):
+        # Con la cola llena se espera al consumidor, salvo que ya se haya ido
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if stop.is_set() or not put(chunk):
+                    return
+            put(_END)
+        except BaseException as e:
+            if not stop.is_set():
+                put(e)
+
+    threading.Thread(target=produce, name="ai-chat-relay", daemon=True).start()
+    finished = False
+    try:
+        while True:
+            try:
+                item = buffer.get(timeout=heartbeat_seconds)
+            except queue.Empty:
+                yield None
+                continue
+            if item is _END:
+                finished = True
+                return
+            if isinstance(item, BaseException):
+                finished = True
+                raise item
+            yield item
+    finally:
+        stop.set()
+        if not finished:
+            try:
+                cancel()
+            except Exception as e:
+                print(f"Error cancelling AI stream: {e}")
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def web_workers():
+    # Mismo valor que usa gunicorn.conf.py para el número de workers
+    return max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+
+def _per_worker(name, total_name, total_default):
+    """Valor por worker: el de name si existe; si no, el total del despliegue repartido entre workers."""
+    value = os.getenv(name)
+    if value:
+        return int(value)
+    total = int(os.getenv(total_name, str(total_default)))
+    return max(1, total // web_workers()) if total > 0 else 0
+
+
+def get_stream_limiter():
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = StreamLimiter(
+                    max_streams=_per_worker("AI_CHAT_MAX_STREAMS", "AI_CHAT_MAX_STREAMS_TOTAL", 20),
+                    max_per_user=int(os.getenv("AI_CHAT_MAX_STREAMS_PER_USER", "2")),
+                    queue_size=_per_worker("AI_CHAT_STREAM_QUEUE_SIZE", "AI_CHAT_STREAM_QUEUE_SIZE_TOTAL", 50),
+                    queue_timeout=float(os.getenv("AI_CHAT_STREAM_QUEUE_TIMEOUT", "10")),
+                )
+    return _limiter
+
+
+def heartbeat_seconds():
+    return float(os.getenv("AI_CHAT_HEARTBEAT_SECONDS", "15"))
@@ -1,6 +1,25 @@
+import os
+import threading
+import time
 from datetime import datetime, timedelta
+from functools import wraps
 import jwt
-from flask import current_app
+from flask import current_app, g, jsonify, request
+from werkzeug.local import LocalProxy
+from api.models import db, User
+from api.utils_scripts.books_cache import MISSING, LRUCache
+
+# Tokens ya verificados -> claims, hasta que caducan. Evita repetir jwt.decode (HMAC)
+# en cada petición autenticada del mismo usuario.
+_token_cache = LRUCache(max_entries=int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "2048")))
+_failures = {"missing_header": 0, "invalid_token": 0, "user_not_found": 0}
+_failures_lock = threading.Lock()
+
+
+def normalize_email(email):
+    """Los emails se guardan y se buscan en minúsculas y sin espacios."""
+    return (email or "").strip().lower()
+
 
 def create_token(user_id, expires_in_hours=5):
     """Create an access token with specified expiration time"""
@@ -13,6 +32,7 @@ def create_token(user_id, expires_in_hours=5):
     }
     return jwt.encode(payload, current_app.config["SECRET_KEY"], algorithm="HS256")
 
+
 def create_refresh_token(user_id):
     """Create a refresh token with longer expiration (7 days)"""
     user_id_str = str(user_id) if user_id else None
@@ -24,24 +44,103 @@ def create_refresh_token(user_id):
     }
     return jwt.encode(payload, current_app.config["SECRET_KEY"], algorithm="HS256")
 
-def verify_token(token):
-    """Verify and decode a JWT token"""
+
+def decode_token(token):
+    """Claims del token si es válido (usando la cache de tokens verificados), o None."""
+    if not token:
+        return None
+    payload = _token_cache.get(token)
+    if payload is not MISSING:
+        return payload
     try:
         payload = jwt.decode(token, current_app.config["SECRET_KEY"], algorithms=["HS256"])
-        return payload["sub"]
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
+    ttl = payload.get("exp", 0) - time.time()
+    if ttl > 0:
+        _token_cache.set(token, payload, ttl)
+    return payload
+
+
+def verify_token(token):
+    """Verify an access token; refresh tokens are rejected"""
+    payload = decode_token(token)
+    if not payload or payload.get("type") != "access":
+        return None
+    return payload["sub"]
+
 
 def verify_refresh_token(token):
     """Verify a refresh token specifically"""
-    try:
-        payload = jwt.decode(token, current_app.config["SECRET_KEY"], algorithms=["HS256"])
-        if payload.get("type") != "refresh":
-            return None
-        return payload["sub"]
-    except jwt.ExpiredSignatureError:
+    payload = decode_token(token)
+    if not payload or payload.get("type") != "refresh":
         return None
-    except jwt.InvalidTokenError:
-        return None
\ No newline at end of file
+    return payload["sub"]
+
+
+def _count_failure(kind):
+    with _failures_lock:
+        _failures[kind] += 1
+
+
+def load_current_user():
+    """Usuario autenticado de la petición; se consulta en la BD solo la primera vez que se pide."""
+    if "_current_user" not in g:
+        g._current_user = db.session.get(User, int(g.user_id)) if g.get("user_id") else None
+        if g._current_user is None:
+            _count_failure("user_not_found")
+    return g._current_user
+
+
+current_user = LocalProxy(load_current_user)
+
+
+def require_auth(fn):
+    """
+    Exige "Authorization: Bearer <access_token>". Deja en g.user_id el id del token
+    (str, como devolvía verify_token) y en g.current_user el usuario, que se carga
+    de la BD solo si la ruta lo usa (load_current_user()).
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        auth_header = request.headers.get("Authorization")
+        if not auth_header or not auth_header.startswith("Bearer "):
+            _count_failure("missing_header")
+            return jsonify({"message": "Missing or invalid Authorization header"}), 401
+
+        user_id = verify_token(auth_header.split(" ")[1])
+        if not user_id:
+            _count_failure("invalid_token")
+            return jsonify({"message": "Invalid or expired token"}), 401
+
+        g.user_id = user_id
+        g.current_user = current_user
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def optional_auth(fn):
+    """
+    Como require_auth, pero sin exigir token: g.user_id queda en None si no hay cabecera
+    o el token no vale (los tokens inválidos se cuentan igual en las métricas).
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        auth_header = request.headers.get("Authorization") or ""
+        user_id = None
+        if auth_header.startswith("Bearer "):
+            user_id = verify_token(auth_header.split(" ", 1)[1].strip())
+            if not user_id:
+                _count_failure("invalid_token")
+        g.user_id = user_id
+        g.current_user = current_user
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def stats():
+    with _failures_lock:
+        failures = dict(_failures)
+    return {"failures": failures, "token_cache": _token_cache.stats()}
@@ -0,0 +1,127 @@
+"""
+Catálogo local de libros.
+
+Cada respuesta de Google Books (búsqueda, ISBN, "Sorpréndeme") se guarda en la
+tabla book, de modo que las consultas repetidas por ISBN se sirven desde la BD
+hasta que el registro supera BOOK_CATALOG_REFRESH_DAYS.
+"""
+import json
+import os
+from datetime import datetime, timedelta
+from sqlalchemy.exc import SQLAlchemyError
+from api.models import db, Book
+
+
+def normalize_isbn(isbn: str) -> str:
+    return (isbn or "").replace("-", "").replace(" ", "").upper()
+
+
+def extract_isbn(volume_info):
+    """ISBN_13/ISBN_10 si existe; si no, cualquier identificador de tipo ISBN."""
+    identifiers = volume_info.get("industryIdentifiers", []) or []
+    for ident in identifiers:
+        if ident.get("type") in ["ISBN_13", "ISBN_10"]:
+            return ident.get("identifier")
+    for ident in identifiers:
+        if "ISBN" in (ident.get("type", "") or ""):
+            return ident.get("identifier")
+    return None
+
+
+def parse_volume(item):
+    """Convierte un item de Google Books (volumes) en el dict que usan nuestras rutas."""
+    vi = item.get("volumeInfo", {}) or {}
+    img = (vi.get("imageLinks", {}) or {})
+    sale_info = (item.get("saleInfo", {}) or {})
+    return {
+        "id": item.get("id"),
+        "title": vi.get("title"),
+        "authors": vi.get("authors", []),
+        "publishedDate": vi.get("publishedDate"),
+        "thumbnail": img.get("thumbnail") or img.get("smallThumbnail"),
+        "isbn": extract_isbn(vi),
+        "publisher": vi.get("publisher"),
+        "description": vi.get("description", ""),
+        "categories": vi.get("categories", []),
+        "pageCount": vi.get("pageCount"),
+        "language": vi.get("language"),
+        "googleBooksUrl": vi.get("infoLink") or vi.get("previewLink") or vi.get("canonicalVolumeLink"),
+        "buyLink": sale_info.get("buyLink"),
+    }
+
+
+def _apply_volume(book, volume, now):
+    # Los datos que el usuario ya tenía (título, portada...) no se pisan; solo se completan.
+    authors = volume.get("authors") or []
+    if not book.author and authors:
+        book.author = ";".join(authors)[:500]
+    if not book.publisher and volume.get("publisher"):
+        book.publisher = volume["publisher"][:50]
+    if not book.thumbnail and volume.get("thumbnail"):
+        book.thumbnail = volume["thumbnail"][:500]
+    if volume.get("description"):
+        book.description = volume["description"]
+    if volume.get("categories"):
+        book.categories = json.dumps(volume["categories"])
+    if volume.get("pageCount"):
+        book.page_count = volume["pageCount"]
+    if volume.get("language"):
+        book.language = volume["language"][:10]
+    if volume.get("publishedDate"):
+        book.published_date = volume["publishedDate"][:20]
+    book.fetched_at = now
+
+
+def save_volumes(volumes):
+    """
+    Inserta o completa en la tabla book los volúmenes parseados con parse_volume.
+    Una sola consulta IN para los existentes y un único commit. Devuelve los Book guardados.
+    Un fallo aquí nunca debe romper la respuesta al usuario, así que se hace rollback y se sigue.
+    """
+    by_isbn = {}
+    for volume in volumes:
+        isbn = normalize_isbn(volume.get("isbn"))
+        if isbn and volume.get("title"):
+            by_isbn[isbn] = volume
+    if not by_isbn:
+        return []
+
+    try:
+        existing = {b.isbn: b for b in Book.query.filter(Book.isbn.in_(list(by_isbn))).all()}
+        now = datetime.utcnow()
+        books = []
+        for isbn, volume in by_isbn.items():
+            book = existing.get(isbn)
+            if book is None:
+                book = Book(isbn=isbn, title=volume["title"][:255])
+                db.session.add(book)
+            _apply_volume(book, volume, now)
+            books.append(book)
+        db.session.commit()
+        return books
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        print(f"Error saving books to catalog: {e}")
+        return []
+
+
+def mark_fetched(*books):
+    """Marca libros como consultados aunque Google no devolviera nada, para no repetir la consulta."""
+    if not books:
+        return
+    try:
+        now = datetime.utcnow()
+        for book in books:
+            book.fetched_at = now
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+
+
+def refresh_after():
+    return timedelta(days=float(os.getenv("BOOK_CATALOG_REFRESH_DAYS", "30")))
+
+
+def is_fresh(book):
+    """True si el libro ya se sincronizó con Google Books y no ha caducado."""
+    return bool(book and book.fetched_at and datetime.utcnow() - book.fetched_at < refresh_after())
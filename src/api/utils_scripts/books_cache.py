@@ -0,0 +1,231 @@
+"""
+Cache de respuestas de Google Books.
+
+Dos niveles:
+- LRUCache: en memoria del proceso, con TTL y expulsión LRU.
+- SQLiteCache: opcional, compartido entre workers de gunicorn a través de un
+  fichero SQLite (BOOKS_CACHE_SQLITE_PATH).
+
+TieredCache combina ambos: primero mira la memoria, luego el fichero compartido,
+y al encontrar algo en el fichero lo sube a memoria.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class LRUCache:
+    """LRU en memoria con TTL por entrada. Thread-safe."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class SQLiteCache:
+    """
+    Cache clave/valor (JSON) en un fichero SQLite, compartido entre procesos.
+    Al escribir, como mucho cada purge_interval segundos por proceso, borra lo caducado
+    y, si quedan más de max_rows filas, las que caducan antes.
+    """
+
+    def __init__(self, path, max_rows=10000, purge_interval=60.0):
+        self.path = path
+        self.max_rows = max_rows
+        self.purge_interval = purge_interval
+        self._local = threading.local()
+        self._purge_lock = threading.Lock()
+        self._next_purge = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.purged = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS books_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_books_cache_expires ON books_cache (expires_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        return self.get_with_ttl(key)[0]
+
+    def get_with_ttl(self, key):
+        """Devuelve (valor, segundos de vida restantes) o (MISSING, 0)."""
+        row = self._connect().execute(
+            "SELECT value, expires_at FROM books_cache WHERE key = ?", (key,)
+        ).fetchone()
+        remaining = row[1] - time.time() if row else 0
+        if row is None or remaining <= 0:
+            self.misses += 1
+            return MISSING, 0
+        self.hits += 1
+        return json.loads(row[0]), remaining
+
+    def set(self, key, value, ttl):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO books_cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), time.time() + ttl),
+        )
+        self._maybe_purge()
+
+    def _maybe_purge(self):
+        now = time.monotonic()
+        with self._purge_lock:
+            if now < self._next_purge:
+                return
+            self._next_purge = now + self.purge_interval
+        self.purge_expired()
+
+    def delete(self, key):
+        self._connect().execute("DELETE FROM books_cache WHERE key = ?", (key,))
+
+    def clear(self):
+        self._connect().execute("DELETE FROM books_cache")
+
+    def purge_expired(self):
+        """Borra las filas caducadas y, por encima de max_rows, las que antes caducan."""
+        conn = self._connect()
+        deleted = conn.execute("DELETE FROM books_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+        deleted += conn.execute(
+            "DELETE FROM books_cache WHERE key IN ("
+            "SELECT key FROM books_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_rows,),
+        ).rowcount
+        self.purged += deleted
+
+    def stats(self):
+        return {"path": self.path, "hits": self.hits, "misses": self.misses, "purged": self.purged}
+
+
+class TieredCache:
+    """Memoria local + backend compartido opcional, con TTL distinto para resultados vacíos."""
+
+    def __init__(self, local, shared=None, ttl=3600, negative_ttl=300):
+        self.local = local
+        self.shared = shared
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not MISSING or self.shared is None:
+            return value
+        try:
+            value, remaining = self.shared.get_with_ttl(key)
+        except sqlite3.Error:
+            return MISSING
+        if value is not MISSING:
+            self.local.set(key, value, remaining)
+        return value
+
+    def set(self, key, value, negative=False):
+        ttl = self.negative_ttl if negative else self.ttl
+        self.local.set(key, value, ttl)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, value, ttl)
+            except sqlite3.Error:
+                pass
+
+    def clear(self):
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self):
+        out = {
+            "ttl": self.ttl,
+            "negative_ttl": self.negative_ttl,
+            "local": self.local.stats(),
+        }
+        if self.shared is not None:
+            out["shared"] = self.shared.stats()
+        return out
+
+
+def search_cache_key(title, lang):
+    """Clave normalizada: minúsculas y espacios colapsados, para que 'Dune ' y 'dune' compartan entrada."""
+    return f"search:{lang or ''}:{' '.join((title or '').lower().split())}"
+
+
+_search_cache = None
+_search_cache_lock = threading.Lock()
+
+
+def get_search_cache():
+    """Devuelve la cache de /books/search del proceso, creándola la primera vez."""
+    global _search_cache
+    if _search_cache is None:
+        with _search_cache_lock:
+            if _search_cache is None:
+                shared_path = os.getenv("BOOKS_CACHE_SQLITE_PATH")
+                _search_cache = TieredCache(
+                    LRUCache(max_entries=int(os.getenv("BOOKS_CACHE_MAX_ENTRIES", "1024"))),
+                    shared=SQLiteCache(
+                        shared_path,
+                        max_rows=int(os.getenv("BOOKS_CACHE_SQLITE_MAX_ROWS", "10000")),
+                        purge_interval=float(os.getenv("BOOKS_CACHE_SQLITE_PURGE_INTERVAL", "60")),
+                    ) if shared_path else None,
+                    ttl=int(os.getenv("BOOKS_CACHE_TTL", "3600")),
+                    negative_ttl=int(os.getenv("BOOKS_CACHE_NEGATIVE_TTL", "300")),
+                )
+    return _search_cache
@@ -0,0 +1,182 @@
+"""
+Directorio local de canales de libro (tabla chat_channel).
+
+/chat/public-channels se sirve solo desde la BD. La tabla se mantiene con:
+- las rutas que crean o unen a canales (con la respuesta que ya devuelve Stream),
+- el webhook de Stream (mensajes nuevos, altas/bajas de miembros, canales borrados),
+- "flask sync-chat-channels" para rellenarla con los canales que ya existían.
+"""
+import hashlib
+import hmac
+from datetime import datetime, timezone
+from sqlalchemy import case, or_
+from sqlalchemy.exc import SQLAlchemyError
+from api.models import db, ChatChannel
+from api.utils_scripts.db_utils import dialect_insert
+
+BOOK_CHANNEL_PREFIX = "book-"
+CHANNEL_TYPE = "messaging"
+
+
+def is_book_channel(channel_id):
+    return bool(channel_id) and str(channel_id).startswith(BOOK_CHANNEL_PREFIX)
+
+
+def parse_stream_time(value):
+    """Fecha ISO de Stream ('2026-01-01T10:00:00.123456789Z') a datetime UTC sin zona, o None."""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def verify_signature(body, signature, api_secret):
+    """Comprueba la cabecera X-Signature del webhook (HMAC-SHA256 del cuerpo con el secret)."""
+    if not signature or not api_secret:
+        return False
+    expected = hmac.new(api_secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def channel_data(response):
+    """Datos del canal dentro de una respuesta de Stream (create/add_members/query_channels)."""
+    if not response:
+        return {}
+    data = response.get("channel") if isinstance(response.get("channel"), dict) else response
+    return data or {}
+
+
+def _channel_values(data):
+    values = {}
+    if data.get("name"):
+        values["name"] = str(data["name"])[:255]
+    if data.get("book_title"):
+        values["book_title"] = str(data["book_title"])[:255]
+    if data.get("isbn"):
+        values["isbn"] = str(data["isbn"])[:20]
+    if isinstance(data.get("member_count"), int):
+        values["member_count"] = max(data["member_count"], 0)
+    created_by = data.get("created_by") if isinstance(data.get("created_by"), dict) else {}
+    created_by_id = data.get("created_by_id") or created_by.get("id")
+    if created_by_id:
+        values["created_by_id"] = str(created_by_id)[:64]
+    created_at = parse_stream_time(data.get("created_at"))
+    if created_at:
+        values["created_at"] = created_at
+    last_message_at = parse_stream_time(data.get("last_message_at"))
+    if last_message_at:
+        values["last_message_at"] = last_message_at
+    return values
+
+
+def _latest(column, value):
+    # Los webhooks pueden llegar desordenados: nunca retroceder una fecha
+    return case((or_(column.is_(None), column < value), value), else_=column)
+
+
+def upsert_channel(channel_id, data=None, member_delta=0, message_at=None):
+    """
+    Crea o actualiza la fila del canal con lo que se sepa de él (data: objeto canal de Stream).
+    member_delta solo se usa cuando Stream no manda member_count. No lanza: un fallo aquí
+    no debe romper la ruta de chat que lo llama.
+    """
+    if not is_book_channel(channel_id):
+        return
+    table = ChatChannel.__table__
+    values = _channel_values(data or {})
+    if message_at and (values.get("last_message_at") is None or message_at > values["last_message_at"]):
+        values["last_message_at"] = message_at
+    now = datetime.utcnow()
+    created_at = values.get("created_at", now)
+    activity = values.get("last_message_at") or created_at
+
+    try:
+        insert = dialect_insert(table).values(
+            id=channel_id,
+            **{
+                **values,
+                "member_count": values.get("member_count", max(member_delta, 0)),
+                "created_at": created_at,
+                "last_activity_at": activity,
+            },
+        ).on_conflict_do_nothing(index_elements=["id"])
+        if db.session.execute(insert).rowcount == 0:
+            update = {k: v for k, v in values.items() if k not in ("created_at", "last_message_at")}
+            if "member_count" not in values and member_delta:
+                new_count = table.c.member_count + member_delta
+                update["member_count"] = case((new_count < 0, 0), else_=new_count)
+            if "last_message_at" in values:
+                update["last_message_at"] = _latest(table.c.last_message_at, values["last_message_at"])
+                update["last_activity_at"] = _latest(table.c.last_activity_at, values["last_message_at"])
+            if update:
+                db.session.execute(table.update().where(table.c.id == channel_id).values(**update))
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        print(f"Error updating chat_channel {channel_id}: {e}")
+
+
+def delete_channel(channel_id):
+    try:
+        ChatChannel.query.filter_by(id=channel_id).delete()
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+
+
+def apply_webhook_event(event):
+    """Aplica un evento del webhook de Stream a la tabla. Devuelve True si tocaba a un canal de libro."""
+    channel = event.get("channel") if isinstance(event.get("channel"), dict) else {}
+    channel_id = event.get("channel_id") or channel.get("id")
+    channel_type = event.get("channel_type") or channel.get("type") or CHANNEL_TYPE
+    if channel_type != CHANNEL_TYPE or not is_book_channel(channel_id):
+        return False
+
+    event_type = event.get("type", "")
+    if event_type == "channel.deleted":
+        delete_channel(channel_id)
+    elif event_type == "message.new":
+        message = event.get("message") or {}
+        sent_at = parse_stream_time(message.get("created_at") or event.get("created_at"))
+        upsert_channel(channel_id, channel, message_at=sent_at)
+    elif event_type == "member.added":
+        upsert_channel(channel_id, channel, member_delta=1)
+    elif event_type == "member.removed":
+        upsert_channel(channel_id, channel, member_delta=-1)
+    elif event_type.startswith("channel."):
+        upsert_channel(channel_id, channel)
+    else:
+        return False
+    return True
+
+
+def sync_from_stream(client, page_size=30):
+    """Recorre todos los canales messaging de Stream y los vuelca en la tabla. Devuelve cuántos."""
+    total = 0
+    offset = 0
+    while True:
+        result = client.query_channels(
+            {"type": CHANNEL_TYPE},
+            [{"created_at": 1}],
+            limit=page_size,
+            offset=offset,
+            state=False,
+            watch=False,
+        )
+        channels = result.get("channels", [])
+        for ch in channels:
+            data = channel_data(ch)
+            if is_book_channel(data.get("id")):
+                upsert_channel(data["id"], data)
+                total += 1
+        if len(channels) < page_size:
+            return total
+        offset += page_size
@@ -0,0 +1,146 @@
+"""
+Historial de conversación de /ai-chat con presupuesto de tokens.
+
+El cliente manda el historial completo en cada turno. Para que el prompt no crezca
+sin límite (ni un cliente pueda mandar megas):
+- se ignoran los mensajes más allá de AI_CHAT_MAX_HISTORY_MESSAGES y cada mensaje
+  se recorta a AI_CHAT_MAX_MESSAGE_CHARS caracteres;
+- los últimos AI_CHAT_KEEP_MESSAGES mensajes van literales;
+- los anteriores se resumen (primera frase de cada uno) mientras quepan en
+  AI_CHAT_HISTORY_TOKEN_BUDGET; el resto se descarta.
+
+Los tokens se estiman (unos 4 caracteres por token) para no llamar a count_tokens,
+que es otra ida y vuelta a Google.
+"""
+import os
+import re
+import threading
+from api.utils_scripts.metrics import LatencyHistogram
+
+CHARS_PER_TOKEN = 4
+SUMMARY_SNIPPET_CHARS = 160
+ROLE_LABELS = {"user": "Usuario", "assistant": "Asistente"}
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+_prompt_tokens = LatencyHistogram(buckets_ms=(250, 500, 1000, 2000, 4000, 8000, 16000), unit="tokens")
+_counters = {"prompts": 0, "summarized_messages": 0, "dropped_messages": 0, "truncated_messages": 0}
+_counters_lock = threading.Lock()
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _settings():
+    return {
+        "budget": int(os.getenv("AI_CHAT_HISTORY_TOKEN_BUDGET", "3000")),
+        "keep": int(os.getenv("AI_CHAT_KEEP_MESSAGES", "6")),
+        "max_messages": int(os.getenv("AI_CHAT_MAX_HISTORY_MESSAGES", "50")),
+        "max_chars": int(os.getenv("AI_CHAT_MAX_MESSAGE_CHARS", "4000")),
+    }
+
+
+def _clean_history(history, max_messages, max_chars):
+    """Solo mensajes {role, content} con texto, los últimos max_messages, recortados a max_chars."""
+    if not isinstance(history, list):
+        return [], 0
+    messages = []
+    truncated = 0
+    for msg in history[-max_messages:]:
+        if not isinstance(msg, dict) or not isinstance(msg.get("content"), str):
+            continue
+        content = msg["content"].strip()
+        if not content:
+            continue
+        if len(content) > max_chars:
+            content = content[:max_chars].rstrip() + "…"
+            truncated += 1
+        role = "user" if msg.get("role") == "user" else "assistant"
+        messages.append((role, content))
+    return messages, truncated
+
+
+def _format_turn(role, content):
+    return f"{ROLE_LABELS[role]}: {content}"
+
+
+def _summary_line(role, content):
+    first = _SENTENCE_END.split(" ".join(content.split()), 1)[0]
+    if len(first) > SUMMARY_SNIPPET_CHARS:
+        first = first[:SUMMARY_SNIPPET_CHARS].rstrip() + "…"
+    return f"- {ROLE_LABELS[role]}: {first}"
+
+
+def build_prompt(system_prompt, history, user_message):
+    """
+    Devuelve (prompt, info). info: prompt_tokens y cuántos mensajes del historial se han
+    mantenido literales, resumido o descartado.
+    """
+    settings = _settings()
+    messages, truncated = _clean_history(history, settings["max_messages"], settings["max_chars"])
+    budget = settings["budget"]
+
+    # Mensajes recientes literales, del más nuevo al más viejo, mientras quepan
+    recent = []
+    used = 0
+    older_count = max(len(messages) - settings["keep"], 0)
+    for role, content in reversed(messages[older_count:]):
+        turn = _format_turn(role, content)
+        cost = estimate_tokens(turn)
+        if used + cost > budget:
+            if recent:
+                break
+            # El último mensaje siempre entra, aunque sea recortado al presupuesto
+            turn = turn[: budget * CHARS_PER_TOKEN].rstrip() + "…"
+            cost = estimate_tokens(turn)
+        recent.append(turn)
+        used += cost
+    recent.reverse()
+    older = messages[: len(messages) - len(recent)]
+
+    # Lo anterior, resumido mientras quede presupuesto (también del más nuevo al más viejo)
+    summary = []
+    for role, content in reversed(older):
+        line = _summary_line(role, content)
+        cost = estimate_tokens(line)
+        if used + cost > budget:
+            break
+        summary.append(line)
+        used += cost
+    summary.reverse()
+    dropped = len(older) - len(summary)
+
+    parts = [system_prompt.strip()]
+    if summary:
+        parts.append("Resumen de la conversación anterior:\n" + "\n".join(summary))
+    parts.extend(recent)
+    parts.append(f"Usuario: {user_message}")
+    parts.append("Asistente:")
+    prompt = "\n\n".join(parts)
+
+    info = {
+        "prompt_tokens": estimate_tokens(prompt),
+        "history_messages": len(messages),
+        "kept": len(recent),
+        "summarized": len(summary),
+        "dropped": dropped,
+        "truncated": truncated,
+    }
+    with _counters_lock:
+        _counters["prompts"] += 1
+        _counters["summarized_messages"] += len(summary)
+        _counters["dropped_messages"] += dropped
+        _counters["truncated_messages"] += truncated
+    _prompt_tokens.observe(info["prompt_tokens"])
+    return prompt, info
+
+
+def stats():
+    with _counters_lock:
+        counters = dict(_counters)
+    return {
+        **counters,
+        "settings": _settings(),
+        "prompt_tokens": _prompt_tokens.snapshot(),
+    }
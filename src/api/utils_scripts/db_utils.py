@@ -0,0 +1,17 @@
+"""
+Helpers de SQL que dependen del motor (PostgreSQL en producción, SQLite en local).
+"""
+from sqlalchemy.dialects import postgresql, sqlite
+from api.models import db
+
+
+def dialect_insert(table):
+    """INSERT con soporte de ON CONFLICT (on_conflict_do_nothing / on_conflict_do_update)."""
+    if db.engine.dialect.name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
+def escape_like(value):
+    """Escapa %, _ y la barra para usar value literal en LIKE (con escape="\\\\")."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
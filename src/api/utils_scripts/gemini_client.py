@@ -0,0 +1,136 @@
+"""
+Modelo de Gemini compartido por el proceso para /ai-chat.
+
+Antes cada petición llamaba a genai.configure, genai.list_models() (una ida y vuelta
+a Google con todo el catálogo) y creaba un GenerativeModel nuevo, todo antes del
+primer token. Ahora el modelo se resuelve una vez y se reutiliza:
+- GEMINI_MODEL fija el modelo y evita list_models() por completo.
+- Si no, se descubre con list_models() y se cachea GEMINI_MODEL_CACHE_TTL segundos
+  (6 h por defecto). Al caducar, un solo hilo lo vuelve a resolver y el resto sigue
+  usando el modelo anterior.
+- Si list_models() falla se usa GEMINI_FALLBACK_MODEL (por defecto un modelo actual
+  conocido) y se reintenta el descubrimiento al cabo de un minuto.
+
+google-generativeai se importa al usarlo, así que sin la librería instalada el resto
+de la API sigue funcionando (las funciones lanzan ImportError).
+"""
+import os
+import threading
+import time
+from api.utils_scripts.metrics import LatencyHistogram
+
+DEFAULT_FALLBACK_MODEL = "gemini-2.5-flash"
+FALLBACK_TTL_SECONDS = 60
+
+_lock = threading.Lock()
+_state = {"api_key": None, "model": None, "model_name": None, "expires_at": 0.0}
+_counters = {"requests": 0, "errors": 0, "resolutions": 0, "resolution_failures": 0}
+_counters_lock = threading.Lock()
+_ttft = LatencyHistogram()
+_total = LatencyHistogram()
+
+
+def _count(name, n=1):
+    # Se llama desde varios hilos de peticiones a la vez
+    with _counters_lock:
+        _counters[name] += n
+
+
+def _discover_model_name(genai):
+    """Primer modelo 'gemini' que soporte generateContent (o cualquiera que lo soporte)."""
+    candidates = [m for m in genai.list_models() if "generateContent" in m.supported_generation_methods]
+    for m in candidates:
+        if "gemini" in m.name.lower():
+            return m.name
+    if candidates:
+        return candidates[0].name
+    raise RuntimeError("No se encontró ningún modelo disponible que soporte generateContent")
+
+
+def _resolve(genai, api_key):
+    genai.configure(api_key=api_key)
+    configured = os.getenv("GEMINI_MODEL")
+    ttl = float(os.getenv("GEMINI_MODEL_CACHE_TTL", "21600"))
+    if configured:
+        model_name = configured
+    else:
+        try:
+            model_name = _discover_model_name(genai)
+            _count("resolutions")
+        except Exception as e:
+            model_name = os.getenv("GEMINI_FALLBACK_MODEL") or DEFAULT_FALLBACK_MODEL
+            print(f"Gemini model discovery failed, using {model_name}: {e}")
+            _count("resolution_failures")
+            ttl = FALLBACK_TTL_SECONDS
+    _state.update(
+        api_key=api_key,
+        model=genai.GenerativeModel(model_name),
+        model_name=model_name,
+        expires_at=time.monotonic() + ttl,
+    )
+
+
+def get_model(api_key):
+    """GenerativeModel del proceso. Solo sale a la red la primera vez y al caducar el TTL."""
+    import google.generativeai as genai
+
+    model = _state["model"]
+    if model is not None and _state["api_key"] == api_key and time.monotonic() < _state["expires_at"]:
+        return model
+    if model is not None and _state["api_key"] == api_key:
+        # Caducado: lo refresca quien consiga el lock; los demás no esperan
+        if not _lock.acquire(blocking=False):
+            return model
+    else:
+        _lock.acquire()
+    try:
+        if (
+            _state["model"] is None
+            or _state["api_key"] != api_key
+            or time.monotonic() >= _state["expires_at"]
+        ):
+            _resolve(genai, api_key)
+        return _state["model"]
+    finally:
+        _lock.release()
+
+
+def generation_config(**overrides):
+    import google.generativeai as genai
+
+    return genai.types.GenerationConfig(**{"temperature": 0.7, "max_output_tokens": 2048, **overrides})
+
+
+def cancel_stream(response):
+    """
+    Corta una generación en streaming (cliente desconectado). El iterador interno
+    es un stream gRPC (cancel) o HTTP (close) según el transporte.
+    """
+    iterator = getattr(response, "_iterator", None)
+    for method in ("cancel", "close"):
+        fn = getattr(iterator, method, None)
+        if callable(fn):
+            fn()
+            return True
+    return False
+
+
+def record_request(ttft_ms, total_ms, error=False):
+    """ttft_ms: hasta el primer trozo de texto (None si no llegó ninguno); total_ms: respuesta completa."""
+    _count("requests")
+    if error:
+        _count("errors")
+    if ttft_ms is not None:
+        _ttft.observe(ttft_ms)
+    _total.observe(total_ms)
+
+
+def stats():
+    with _counters_lock:
+        counters = dict(_counters)
+    return {
+        "model": _state["model_name"],
+        **counters,
+        "time_to_first_token_ms": _ttft.snapshot(),
+        "total_ms": _total.snapshot(),
+    }
@@ -0,0 +1,97 @@
+"""
+Utilidades geográficas para buscar eventos cercanos.
+
+Cada evento guarda su geohash (precisión 9, ~5 m). Un geohash es un prefijo
+de sus celdas "padre", así que "eventos dentro de una celda" es un rango de
+strings que un índice B-tree resuelve sin recorrer la tabla.
+"""
+import math
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_KM_PER_DEGREE = 111.32
+EARTH_RADIUS_KM = 6371.0088
+GEOHASH_PRECISION = 9
+
+
+def encode_geohash(lat, lng, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bit = 0
+    value = 0
+    even = True  # los bits pares son de longitud
+    while len(chars) < precision:
+        rng, coord = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if coord >= mid:
+            value = (value << 1) | 1
+            rng[0] = mid
+        else:
+            value <<= 1
+            rng[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(_BASE32[value])
+            bit = 0
+            value = 0
+    return "".join(chars)
+
+
+def cell_size_degrees(precision):
+    """(alto, ancho) en grados de una celda de esa precisión."""
+    bits = 5 * precision
+    lng_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lng_bits)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def covering_cells(lat, lng, radius_km):
+    """
+    Celdas geohash (la del centro y sus 8 vecinas) que cubren el círculo dado.
+    Se elige la precisión más fina cuya celda mide al menos radius_km en ambas
+    direcciones. Devuelve None si el radio es tan grande que no compensa filtrar.
+    """
+    # La anchura de una celda se estrecha hacia los polos: usar la latitud más desfavorable del círculo
+    worst_lat = min(89.9, abs(lat) + radius_km / _KM_PER_DEGREE)
+    km_per_deg_lng = _KM_PER_DEGREE * math.cos(math.radians(worst_lat))
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size_degrees(precision)
+        if height * _KM_PER_DEGREE >= radius_km and width * km_per_deg_lng >= radius_km:
+            break
+    else:
+        return None
+
+    cells = set()
+    for dlat in (-height, 0.0, height):
+        cell_lat = lat + dlat
+        if cell_lat < -90 or cell_lat > 90:
+            continue
+        for dlng in (-width, 0.0, width):
+            cell_lng = (lng + dlng + 180.0) % 360.0 - 180.0
+            cells.add(encode_geohash(cell_lat, cell_lng, precision))
+    return cells
+
+
+def prefix_range(prefix):
+    """
+    (inicio, fin) tal que todo geohash que empieza por prefix cumple inicio <= g < fin.
+    fin es None si no hay cota superior. Solo usa caracteres del alfabeto geohash,
+    así que el orden coincide en cualquier collation.
+    """
+    upper = prefix
+    while upper:
+        idx = _BASE32.index(upper[-1])
+        if idx + 1 < len(_BASE32):
+            return prefix, upper[:-1] + _BASE32[idx + 1]
+        upper = upper[:-1]
+    return prefix, None
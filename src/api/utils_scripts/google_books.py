@@ -0,0 +1,88 @@
+"""
+Cliente de la API de Google Books (volumes) compartido por todas las rutas.
+
+Las peticiones idénticas que llegan a la vez se agrupan con SingleFlight, así que
+un libro "de moda" genera una sola llamada a Google aunque lo pidan muchos usuarios.
+Todas salen por el cliente HTTP compartido "google_books" (keep-alive, reintentos,
+circuit breaker).
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from api.utils_scripts.book_catalog import parse_volume
+from api.utils_scripts.http_client import CircuitOpenError, get_http_client
+from api.utils_scripts.singleflight import SingleFlight
+
+GOOGLE_BOOKS_URL = "https://www.googleapis.com/books/v1/volumes"
+
+
+class GoogleBooksError(Exception):
+    """Google Books respondió con un status distinto de 200."""
+
+    def __init__(self, status_code, body=""):
+        Exception.__init__(self, f"Google Books returned {status_code}")
+        self.status_code = status_code
+        self.body = body
+
+
+_flight = SingleFlight()
+
+
+def _get_volumes(params):
+    try:
+        r = get_http_client("google_books").get(
+            GOOGLE_BOOKS_URL, params=params, timeout=10, headers={"User-Agent": "Mozilla/5.0"}
+        )
+    except CircuitOpenError as e:
+        # Mientras Google nos limita no se sale a la red: se responde como un 429
+        raise GoogleBooksError(429, str(e))
+    if r.status_code != 200:
+        raise GoogleBooksError(r.status_code, r.text[:300])
+    return r.json()
+
+
+def fetch_volumes(params):
+    """
+    GET /volumes con los params dados (se añade GOOGLE_BOOKS_API_KEY si existe).
+    Devuelve el JSON de Google. Lanza GoogleBooksError o requests.RequestException.
+    El dict devuelto puede estar compartido entre hilos: no modificarlo.
+    """
+    params = dict(params)
+    google_books_api_key = os.getenv("GOOGLE_BOOKS_API_KEY")
+    if google_books_api_key:
+        params["key"] = google_books_api_key
+    key = tuple(sorted(params.items()))
+    return _flight.do(key, lambda: _get_volumes(params))
+
+
+_lookup_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("GOOGLE_BOOKS_LOOKUP_WORKERS", "8")),
+    thread_name_prefix="google-books",
+)
+
+
+def _lookup_isbn(isbn):
+    items = fetch_volumes({"q": f"isbn:{isbn}", "maxResults": 1}).get("items", []) or []
+    return parse_volume(items[0]) if items else None
+
+
+def lookup_isbns(isbns):
+    """
+    Busca varios ISBN (ya normalizados) en paralelo con un pool de hilos acotado,
+    compartido por todo el proceso. Devuelve {isbn: volumen parseado, None si Google
+    no lo conoce, o la excepción si la consulta falló}.
+    """
+    futures = {isbn: _lookup_pool.submit(_lookup_isbn, isbn) for isbn in isbns}
+    results = {}
+    for isbn, future in futures.items():
+        try:
+            results[isbn] = future.result()
+        except Exception as e:
+            results[isbn] = e
+    return results
+
+
+def stats():
+    return {
+        "singleflight": _flight.stats(),
+        "http": get_http_client("google_books").stats(),
+    }
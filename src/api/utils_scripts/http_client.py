@@ -0,0 +1,209 @@
+"""
+Cliente HTTP saliente compartido.
+
+- Una requests.Session por servicio, con pool de conexiones keep-alive por host.
+- Reintentos acotados con backoff exponencial y jitter en 429/5xx y errores de red.
+- Circuit breaker: tras varias peticiones fallidas seguidas (cada una cuenta una vez,
+  con todos sus reintentos) o un 429 deja de llamar durante un tiempo y falla al
+  instante con CircuitOpenError.
+- Histograma de latencias por servicio.
+"""
+import os
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from api.utils_scripts.metrics import LatencyHistogram
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.RequestException):
+    """El circuito está abierto: no se llama al servicio remoto."""
+
+    def __init__(self, name, retry_in):
+        requests.RequestException.__init__(self, f"Circuit '{name}' open, retry in {retry_in:.1f}s")
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, cooldown=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._open_until = 0.0
+        self._probing = False
+        self.opened = 0
+
+    def before_request(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._open_until > now:
+                raise CircuitOpenError(self.name, self._open_until - now)
+            if self._open_until and self._probing:
+                # Medio abierto: ya hay una petición de prueba en curso
+                raise CircuitOpenError(self.name, 1.0)
+            if self._open_until:
+                self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._open_until = 0.0
+            self._probing = False
+
+    def release_probe(self):
+        """Termina la petición de prueba sin contarla como éxito ni como fallo."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self, open_for=None):
+        """open_for fuerza la apertura (p. ej. un 429 con Retry-After)."""
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if open_for is not None or self._failures >= self.failure_threshold:
+                self._open_until = time.monotonic() + (open_for or self.cooldown)
+                self.opened += 1
+
+    def state(self):
+        with self._lock:
+            if self._open_until > time.monotonic():
+                return "open"
+            return "half_open" if self._open_until else "closed"
+
+
+def _retry_after_seconds(response):
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class PooledHttpClient:
+    def __init__(self, name, pool_maxsize=10, max_retries=2, backoff_base=0.25,
+                 backoff_cap=2.0, failure_threshold=5, cooldown=30.0):
+        self.name = name
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.session = requests.Session()
+        # pool_maxsize es el número de conexiones keep-alive por host
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.breaker = CircuitBreaker(name, failure_threshold=failure_threshold, cooldown=cooldown)
+        self.latency = LatencyHistogram()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+
+    def _count(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None and retry_after <= self.backoff_cap:
+            return retry_after
+        # Full jitter: uniforme entre 0 y el exponencial acotado
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def request(self, method, url, **kwargs):
+        """
+        Una petición lógica, con sus reintentos, cuenta como un solo éxito o fallo para el
+        circuit breaker; así max_retries intentos fallidos no abren el circuito por sí solos.
+        """
+        self.breaker.before_request()
+        recorded = False
+        try:
+            for attempt in range(self.max_retries + 1):
+                self._count("requests")
+                start = time.perf_counter()
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                except requests.RequestException:
+                    self.latency.observe((time.perf_counter() - start) * 1000)
+                    self._count("errors")
+                    if attempt >= self.max_retries:
+                        recorded = True
+                        self.breaker.record_failure()
+                        raise
+                    self._count("retries")
+                    time.sleep(self._backoff(attempt))
+                    continue
+                self.latency.observe((time.perf_counter() - start) * 1000)
+
+                if response.status_code not in RETRY_STATUSES:
+                    recorded = True
+                    self.breaker.record_success()
+                    return response
+
+                self._count("errors")
+                retry_after = _retry_after_seconds(response)
+                last_attempt = attempt >= self.max_retries
+                if response.status_code == 429 and (last_attempt or (retry_after or 0) > self.backoff_cap):
+                    # Seguimos limitados: abrir el circuito para fallar rápido hasta que pase el Retry-After
+                    recorded = True
+                    self.breaker.record_failure(open_for=retry_after or self.breaker.cooldown)
+                    return response
+                if last_attempt:
+                    recorded = True
+                    self.breaker.record_failure()
+                    return response
+                self._count("retries")
+                time.sleep(self._backoff(attempt, retry_after))
+        finally:
+            if not recorded:
+                # Otra excepción (timeout de gevent, error al leer...): liberar la prueba de medio
+                # abierto para que el circuito no se quede bloqueado
+                self.breaker.release_probe()
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "errors": self.errors,
+            "circuit": self.breaker.state(),
+            "circuit_opened": self.breaker.opened,
+            "latency_ms": self.latency.snapshot(),
+        }
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_http_client(name):
+    """
+    Cliente compartido por nombre de servicio. La configuración se lee de variables
+    de entorno con el prefijo del nombre, p. ej. GOOGLE_BOOKS_HTTP_POOL_SIZE.
+    """
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                prefix = name.upper() + "_HTTP_"
+                client = PooledHttpClient(
+                    name,
+                    pool_maxsize=int(os.getenv(prefix + "POOL_SIZE", "10")),
+                    max_retries=int(os.getenv(prefix + "MAX_RETRIES", "2")),
+                    backoff_base=float(os.getenv(prefix + "BACKOFF_BASE", "0.25")),
+                    backoff_cap=float(os.getenv(prefix + "BACKOFF_CAP", "2.0")),
+                    failure_threshold=int(os.getenv(prefix + "FAILURE_THRESHOLD", "5")),
+                    cooldown=float(os.getenv(prefix + "COOLDOWN", "30")),
+                )
+                _clients[name] = client
+    return client
+
+
+def stats():
+    return {name: client.stats() for name, client in list(_clients.items())}
@@ -0,0 +1,46 @@
+"""
+Métricas en memoria del proceso (se exponen en GET /api/metrics).
+"""
+import threading
+
+DEFAULT_BUCKETS_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyHistogram:
+    """
+    Histograma acumulado de latencias en milisegundos (estilo Prometheus).
+    Con unit se puede usar para otras magnitudes (p. ej. unit="tokens").
+    """
+
+    def __init__(self, buckets_ms=DEFAULT_BUCKETS_MS, unit="ms"):
+        self.buckets_ms = tuple(buckets_ms)
+        self.unit = unit
+        self._counts = [0] * (len(self.buckets_ms) + 1)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total_ms = 0.0
+
+    def observe(self, ms):
+        with self._lock:
+            self.count += 1
+            self.total_ms += ms
+            for i, upper in enumerate(self.buckets_ms):
+                if ms <= upper:
+                    self._counts[i] += 1
+                    break
+            else:
+                self._counts[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            buckets = {}
+            running = 0
+            for upper, n in zip(self.buckets_ms, self._counts):
+                running += n
+                buckets[f"le_{upper}"] = running
+            buckets["le_inf"] = running + self._counts[-1]
+            return {
+                "count": self.count,
+                f"avg_{self.unit}": round(self.total_ms / self.count, 2) if self.count else None,
+                "buckets": buckets,
+            }
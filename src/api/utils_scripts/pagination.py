@@ -0,0 +1,62 @@
+"""
+Paginación por cursor (keyset).
+
+El cursor es opaco para el cliente: los valores de las columnas de orden de la
+última fila devuelta, en JSON y base64. La siguiente página filtra "filas
+estrictamente después" de esos valores, así que usa los índices y no depende
+de OFFSET.
+"""
+import base64
+import json
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, types=None):
+    """
+    Devuelve la lista de valores del cursor. Con types (p. ej. (str, str, int)) comprueba
+    también cuántos valores hay y de qué tipo es cada uno. Lanza ValueError si no es válido.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    if types is not None:
+        if len(values) != len(types):
+            raise ValueError("Invalid cursor")
+        for value, expected in zip(values, types):
+            # bool es subclase de int en Python, pero no es un valor válido
+            if not isinstance(value, expected) or isinstance(value, bool):
+                raise ValueError("Invalid cursor")
+    return values
+
+
+def parse_limit(raw, default, maximum):
+    """limit de la query string acotado a [1, maximum]. Lanza ValueError si no es un entero."""
+    if raw in (None, ""):
+        return default
+    return max(1, min(int(raw), maximum))
+
+
+def keyset_after(keys, values):
+    """
+    Condición "fila posterior al cursor" para un ORDER BY de varias columnas.
+    keys: [(columna, descendente)], values: valores del cursor en el mismo orden.
+    Las columnas de orden no deben admitir NULL.
+    """
+    condition = None
+    for (column, descending), value in reversed(list(zip(keys, values))):
+        after = column < value if descending else column > value
+        condition = after if condition is None else or_(after, and_(column == value, condition))
+    return condition
+
+
+def order_by_keys(keys):
+    return [column.desc() if descending else column.asc() for column, descending in keys]
@@ -0,0 +1,188 @@
+"""
+Hash de contraseñas configurable.
+
+- PASSWORD_HASH_METHOD: cualquier método de werkzeug ("pbkdf2:sha256:600000",
+  "scrypt:32768:8:1"...) o "argon2" si está instalado argon2-cffi (parámetros en
+  PASSWORD_ARGON2_TIME_COST, PASSWORD_ARGON2_MEMORY_COST y PASSWORD_ARGON2_PARALLELISM).
+  Sin configurar se usa el método por defecto de werkzeug, como antes. Un método que no
+  se puede usar hace fallar el arranque de la app (get_hasher() en app.py).
+- Los hashes guardados con otro método o parámetros se siguen aceptando y se
+  rehacen con el método actual en el siguiente login correcto (needs_rehash).
+- El cálculo se hace en un pool de PASSWORD_HASH_WORKERS hilos (por defecto, uno
+  por núcleo) para que un pico de logins no acapare a los workers web. Con gevent
+  se usa un pool de hilos reales de gevent, ya que el hash no cede el control.
+- "flask bench-password-hashing" mide logins por segundo y núcleo con cada método.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+from api.utils_scripts.metrics import LatencyHistogram
+
+try:
+    import argon2
+except ImportError:  # opcional
+    argon2 = None
+
+ARGON2_PREFIX = "$argon2"
+
+
+class _WerkzeugHasher:
+    def __init__(self, method=None):
+        self.method = method
+        self._kwargs = {"method": method} if method else {}
+        # Prefijo que genera este método ("pbkdf2:sha256:600000", "scrypt:32768:8:1"...)
+        self.prefix = generate_password_hash("x", **self._kwargs).split("$", 1)[0]
+        self.name = self.prefix
+
+    def hash(self, password):
+        return generate_password_hash(password, **self._kwargs)
+
+    def needs_rehash(self, stored):
+        return stored.startswith(ARGON2_PREFIX) or stored.split("$", 1)[0] != self.prefix
+
+
+class _Argon2Hasher:
+    def __init__(self, time_cost, memory_cost, parallelism):
+        self._hasher = argon2.PasswordHasher(
+            time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism
+        )
+        self.name = f"argon2id:t={time_cost}:m={memory_cost}:p={parallelism}"
+
+    def hash(self, password):
+        return self._hasher.hash(password)
+
+    def needs_rehash(self, stored):
+        return not stored.startswith(ARGON2_PREFIX) or self._hasher.check_needs_rehash(stored)
+
+
+def make_hasher(method=None):
+    """Hasher para el método dado ("argon2", un método de werkzeug o None = por defecto)."""
+    if method == "argon2":
+        if argon2 is None:
+            raise RuntimeError("PASSWORD_HASH_METHOD=argon2 requires the argon2-cffi package (pipenv install argon2-cffi)")
+        return _Argon2Hasher(
+            time_cost=int(os.getenv("PASSWORD_ARGON2_TIME_COST", "3")),
+            memory_cost=int(os.getenv("PASSWORD_ARGON2_MEMORY_COST", "65536")),
+            parallelism=int(os.getenv("PASSWORD_ARGON2_PARALLELISM", "4")),
+        )
+    return _WerkzeugHasher(method or None)
+
+
+def _check(stored, password):
+    if stored.startswith(ARGON2_PREFIX):
+        if argon2 is None:
+            return False
+        try:
+            return argon2.PasswordHasher().verify(stored, password)
+        except (argon2.exceptions.VerificationError, argon2.exceptions.InvalidHashError):
+            return False
+    return check_password_hash(stored, password)
+
+
+_hasher = None
+_pool = None
+_pool_lock = threading.Lock()
+_counters = {"hashes": 0, "verifications": 0, "failed_verifications": 0, "rehashes": 0}
+_counters_lock = threading.Lock()
+_latency = LatencyHistogram()
+
+
+def _count(name, n=1):
+    # Se llama desde varios hilos de peticiones a la vez
+    with _counters_lock:
+        _counters[name] += n
+
+
+def get_hasher():
+    global _hasher
+    if _hasher is None:
+        with _pool_lock:
+            if _hasher is None:
+                _hasher = make_hasher(os.getenv("PASSWORD_HASH_METHOD"))
+    return _hasher
+
+
+def _workers():
+    return int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+
+
+def _gevent_patched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("threading")
+
+
+def _run(fn, *args):
+    """Ejecuta fn en el pool acotado de hash y espera el resultado."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if _gevent_patched():
+                    from gevent.threadpool import ThreadPool
+                    _pool = ThreadPool(_workers())
+                else:
+                    _pool = ThreadPoolExecutor(max_workers=_workers(), thread_name_prefix="password-hash")
+    start = time.perf_counter()
+    try:
+        if isinstance(_pool, ThreadPoolExecutor):
+            return _pool.submit(fn, *args).result()
+        return _pool.apply(fn, args)
+    finally:
+        _latency.observe((time.perf_counter() - start) * 1000)
+
+
+def hash_password(password):
+    _count("hashes")
+    return _run(get_hasher().hash, password)
+
+
+def verify_password(stored, password):
+    if not stored or password is None:
+        return False
+    _count("verifications")
+    ok = _run(_check, stored, password)
+    if not ok:
+        _count("failed_verifications")
+    return ok
+
+
+def needs_rehash(stored):
+    return bool(stored) and get_hasher().needs_rehash(stored)
+
+
+def record_rehash():
+    _count("rehashes")
+
+
+def benchmark(method, seconds=2.0, password="correct horse battery staple"):
+    """Verificaciones por segundo en un solo hilo (= logins/s por núcleo) con el método dado."""
+    hasher = make_hasher(method)
+    stored = hasher.hash(password)
+    count = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < seconds:
+        _check(stored, password)
+        count += 1
+        elapsed = time.perf_counter() - start
+    return {
+        "method": hasher.name,
+        "logins_per_sec_per_core": round(count / elapsed, 1),
+        "ms_per_login": round(elapsed * 1000 / count, 2),
+    }
+
+
+def stats():
+    with _counters_lock:
+        counters = dict(_counters)
+    return {
+        "method": get_hasher().name,
+        "workers": _workers(),
+        **counters,
+        "latency_ms": _latency.snapshot(),
+    }
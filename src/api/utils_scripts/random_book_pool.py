@@ -0,0 +1,234 @@
+"""
+Reserva de libros para "Sorpréndeme" (/ai-chat/random-book).
+
+Antes cada clic hacía una búsqueda de 40 resultados en Google Books y usaba uno.
+Ahora, por cada término de búsqueda, el proceso guarda la lista de libros ya
+parseados y cada clic saca uno al azar en memoria. Solo la recarga habla con
+Google, en segundo plano, cuando a un término le quedan RANDOM_BOOK_POOL_LOW_WATER
+libros o menos o su lista tiene más de RANDOM_BOOK_POOL_MAX_AGE segundos.
+Cada recarga pide otra página de resultados (startIndex aleatorio) para variar.
+
+Los términos se cargan según se usan, no todos al arrancar: cada clic elige un término
+y, si aún no tiene libros, lo recarga en segundo plano y sirve el libro de otro. Así un
+despliegue no lanza 15 búsquedas por proceso a la vez. Solo en frío (ningún término con
+libros todavía) el clic espera a una recarga, de un único término: si ya hay otra en
+curso espera a esa en vez de lanzar una segunda búsqueda.
+
+Cada recarga guarda sus libros en la tabla book de una vez (save_volumes), así el clic
+solo saca un libro de memoria, sin consultas ni commits.
+"""
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from api.utils_scripts.google_books import fetch_volumes
+from api.utils_scripts.book_catalog import parse_volume, save_volumes
+
+SEARCH_TERMS = [
+    "best seller", "novela", "ciencia ficción", "fantasía", "misterio",
+    "romance", "historia", "biografía", "aventura", "thriller",
+    "literatura", "clásico", "contemporáneo", "drama", "comedia"
+]
+PAGE_SIZE = 40
+MAX_START_INDEX = 120
+RETRY_AFTER_FAILURE_SECONDS = 60
+COLD_WAIT_SECONDS = 15
+
+
+class _TermPool:
+    def __init__(self):
+        self.books = []
+        self.fetched_at = 0.0
+        self.refilling = False
+        self.retry_at = 0.0
+
+
+def fetch_candidates(term):
+    """Una página de resultados de Google Books para el término, ya parseada."""
+    params = {
+        "q": term,
+        "maxResults": PAGE_SIZE,
+        "startIndex": random.randrange(0, MAX_START_INDEX + 1, PAGE_SIZE),
+        "langRestrict": "es",
+        "printType": "books",
+        "orderBy": "relevance",
+    }
+    items = fetch_volumes(params).get("items", []) or []
+    if not items and params["startIndex"]:
+        # Términos con pocos resultados: volver a la primera página
+        items = fetch_volumes({**params, "startIndex": 0}).get("items", []) or []
+    books = []
+    for item in items:
+        book = parse_volume(item)
+        if book.get("title"):
+            book.pop("publisher", None)
+            books.append(book)
+    return books
+
+
+class RandomBookPool:
+    def __init__(self, terms, fetch=fetch_candidates, persist=None, low_water=10,
+                 max_age=6 * 3600, workers=2):
+        self.terms = list(terms)
+        self.fetch = fetch
+        self.persist = persist
+        self.low_water = low_water
+        self.max_age = max_age
+        self._pools = {term: _TermPool() for term in self.terms}
+        self._lock = threading.Lock()
+        self._refilled = threading.Condition(self._lock)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="random-book-pool")
+        self.pops = 0
+        self.cold_misses = 0
+        self.cold_waits = 0
+        self.refills = 0
+        self.refill_failures = 0
+
+    def pop(self):
+        """
+        Un libro al azar (dict de parse_volume) o None si Google no devolvió nada.
+        En frío puede lanzar GoogleBooksError / requests.RequestException.
+        """
+        with self._lock:
+            term = random.choice(self.terms)
+            book = self._take(term)
+            if book is None:
+                self.cold_misses += 1
+                if any(p.refilling for p in self._pools.values()):
+                    # Ya hay una recarga en curso: esperarla en vez de pedir otra a Google
+                    self.cold_waits += 1
+                    self._refilled.wait_for(self._cold_ready, timeout=COLD_WAIT_SECONDS)
+                    book = self._take(term)
+            if book is not None:
+                return dict(book)
+            idle = [t for t in self.terms if not self._pools[t].refilling]
+            if not idle:
+                return None
+            if term not in idle:
+                term = random.choice(idle)
+            self._pools[term].refilling = True
+
+        # En frío: recargar el término elegido ahora mismo (como hacía la ruta antes)
+        try:
+            books = self._load(term)
+        except Exception:
+            with self._lock:
+                self._pools[term].refilling = False
+                self._refilled.notify_all()
+            raise
+        book = books.pop(random.randrange(len(books))) if books else None
+        with self._lock:
+            self._store(term, books)
+            if book is not None:
+                self.pops += 1
+        return dict(book) if book is not None else None
+
+    def _take(self, term):
+        # Llamar con self._lock tomado. None si ningún término tiene libros.
+        source = term if self._pools[term].books else None
+        if source is None:
+            available = [t for t in self.terms if self._pools[t].books]
+            if not available:
+                return None
+            # El término elegido se rellena en segundo plano; mientras, sale de otro
+            self._schedule_if_needed(term)
+            source = random.choice(available)
+        pool = self._pools[source]
+        book = pool.books.pop(random.randrange(len(pool.books)))
+        self.pops += 1
+        self._schedule_if_needed(source)
+        return book
+
+    def _cold_ready(self):
+        pools = self._pools.values()
+        return any(p.books for p in pools) or not any(p.refilling for p in pools)
+
+    def _load(self, term):
+        books = self.fetch(term)
+        if books and self.persist is not None:
+            try:
+                self.persist(books)
+            except Exception as e:
+                # Sin guardar en la tabla book el libro se puede servir igual
+                print(f"Random book pool could not save books for '{term}': {e}")
+        return books
+
+    def _needs_refill(self, pool, now):
+        if pool.refilling or now < pool.retry_at:
+            return False
+        return len(pool.books) <= self.low_water or now - pool.fetched_at > self.max_age
+
+    def _schedule_if_needed(self, term):
+        # Llamar con self._lock tomado
+        pool = self._pools[term]
+        if self._needs_refill(pool, time.monotonic()):
+            pool.refilling = True
+            self._executor.submit(self._refill, term)
+
+    def _refill(self, term):
+        try:
+            books = self._load(term)
+        except Exception as e:
+            print(f"Random book pool refill failed for '{term}': {e}")
+            with self._lock:
+                self.refill_failures += 1
+                pool = self._pools[term]
+                pool.refilling = False
+                pool.retry_at = time.monotonic() + RETRY_AFTER_FAILURE_SECONDS
+                self._refilled.notify_all()
+            return
+        with self._lock:
+            self.refills += 1
+            self._store(term, books)
+
+    def _store(self, term, books):
+        # Llamar con self._lock tomado
+        pool = self._pools[term]
+        pool.books = books
+        pool.fetched_at = time.monotonic()
+        pool.refilling = False
+        if not books:
+            # Término sin resultados: no insistir en cada clic
+            pool.retry_at = pool.fetched_at + RETRY_AFTER_FAILURE_SECONDS
+        self._refilled.notify_all()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pops": self.pops,
+                "cold_misses": self.cold_misses,
+                "cold_waits": self.cold_waits,
+                "refills": self.refills,
+                "refill_failures": self.refill_failures,
+                "available": sum(len(p.books) for p in self._pools.values()),
+                "terms": {term: len(p.books) for term, p in self._pools.items()},
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _saver(app):
+    # Las recargas corren en hilos sin contexto de Flask: se abre uno con la app
+    def persist(books):
+        with app.app_context():
+            save_volumes(books)
+    return persist
+
+
+def get_random_book_pool():
+    """Reserva de "Sorpréndeme" del proceso, creada la primera vez (dentro de una petición)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = RandomBookPool(
+                    SEARCH_TERMS,
+                    persist=_saver(current_app._get_current_object()),
+                    low_water=int(os.getenv("RANDOM_BOOK_POOL_LOW_WATER", "10")),
+                    max_age=float(os.getenv("RANDOM_BOOK_POOL_MAX_AGE", str(6 * 3600))),
+                )
+    return _pool
@@ -0,0 +1,176 @@
+"""
+Cliente servidor de Stream Chat compartido por todo el proceso.
+
+Antes cada ruta creaba un StreamChat nuevo (y con él una sesión HTTP nueva, sin
+reutilizar conexiones). Ahora hay una sola instancia por proceso con un pool de
+conexiones keep-alive, y cada llamada a Stream queda medida por operación
+(método + ruta con los ids sustituidos): número de llamadas, errores y latencia.
+"""
+import os
+import threading
+import time
+import weakref
+import requests
+from requests.adapters import HTTPAdapter
+from stream_chat import StreamChat
+from api.utils_scripts.metrics import LatencyHistogram
+
+
+class _OperationStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency = LatencyHistogram()
+
+
+_ops = {}
+_ops_lock = threading.Lock()
+
+
+# Subrutas de /users que no son ids de usuario
+_USER_COLLECTION_ACTIONS = {"restore", "delete", "deactivate", "reactivate"}
+
+
+def operation_name(method, path):
+    """'POST /channels/messaging/book-isbn-123/query' -> 'POST /channels/{type}/{id}/query'."""
+    parts = [p for p in path.split("?", 1)[0].split("/") if p]
+    if parts and parts[0] == "channels" and len(parts) >= 3:
+        parts[1], parts[2] = "{type}", "{id}"
+    elif len(parts) >= 2 and parts[0] == "users" and parts[1] not in _USER_COLLECTION_ACTIONS:
+        parts[1] = "{id}"
+    return f"{method.upper()} /" + "/".join(parts)
+
+
+def record_call(operation, elapsed_ms, error):
+    with _ops_lock:
+        stats = _ops.get(operation)
+        if stats is None:
+            stats = _ops[operation] = _OperationStats()
+        stats.calls += 1
+        if error:
+            stats.errors += 1
+    stats.latency.observe(elapsed_ms)
+
+
+class InstrumentedSession(requests.Session):
+    """requests.Session que registra cada petición a Stream en las métricas por operación."""
+
+    def request(self, method, url, *args, **kwargs):
+        operation = operation_name(method, requests.utils.urlparse(url).path)
+        start = time.perf_counter()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except requests.RequestException:
+            record_call(operation, (time.perf_counter() - start) * 1000, error=True)
+            raise
+        record_call(operation, (time.perf_counter() - start) * 1000, error=response.status_code >= 400)
+        return response
+
+
+def _credentials():
+    api_key = os.getenv("STREAM_API_KEY")
+    api_secret = os.getenv("STREAM_API_SECRET")
+
+    if not api_key or not api_secret:
+        raise ValueError("STREAM_API_KEY and STREAM_API_SECRET must be set in environment variables")
+    return api_key, api_secret
+
+
+_client = None
+_client_credentials = None
+_client_lock = threading.Lock()
+
+
+def get_stream_client():
+    """StreamChat del proceso, creado la primera vez (o si cambian las credenciales)."""
+    global _client, _client_credentials
+    credentials = _credentials()
+    if _client is not None and _client_credentials == credentials:
+        return _client
+    with _client_lock:
+        if _client is None or _client_credentials != credentials:
+            client = StreamChat(
+                api_key=credentials[0],
+                api_secret=credentials[1],
+                timeout=float(os.getenv("STREAM_HTTP_TIMEOUT", "6")),
+            )
+            session = InstrumentedSession()
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=int(os.getenv("STREAM_HTTP_POOL_SIZE", "10")),
+                max_retries=1,
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            client.set_http_session(session)
+            _client, _client_credentials = client, credentials
+    return _client
+
+
+# Los clientes async (aiohttp) están ligados a un event loop: uno por loop
+_async_clients = weakref.WeakKeyDictionary()
+
+
+async def get_async_stream_client():
+    """
+    Variante async (StreamChatAsync) para código que corre en un event loop:
+    client = await get_async_stream_client(). Reutiliza un cliente por loop, con las
+    mismas métricas por operación que el síncrono. Requiere aiohttp.
+    """
+    import asyncio
+    import aiohttp
+    from stream_chat import StreamChatAsync
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is not None:
+        return client
+
+    api_key, api_secret = _credentials()
+    client = StreamChatAsync(
+        api_key=api_key,
+        api_secret=api_secret,
+        timeout=float(os.getenv("STREAM_HTTP_TIMEOUT", "6")),
+    )
+
+    async def on_start(session, ctx, params):
+        ctx.start = time.perf_counter()
+
+    async def on_end(session, ctx, params):
+        record_call(operation_name(params.method, params.url.path),
+                    (time.perf_counter() - ctx.start) * 1000, error=params.response.status >= 400)
+
+    async def on_exception(session, ctx, params):
+        record_call(operation_name(params.method, params.url.path),
+                    (time.perf_counter() - ctx.start) * 1000, error=True)
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(on_start)
+    trace.on_request_end.append(on_end)
+    trace.on_request_exception.append(on_exception)
+    # Sustituye la sesión por defecto: mismo base_url, con keep-alive, límite de conexiones y métricas
+    await client.session.close()
+    client.set_http_session(aiohttp.ClientSession(
+        base_url=client.base_url,
+        connector=aiohttp.TCPConnector(
+            keepalive_timeout=59.0,
+            limit=int(os.getenv("STREAM_HTTP_POOL_SIZE", "10")),
+        ),
+        trace_configs=[trace],
+    ))
+    _async_clients[loop] = client
+    return client
+
+
+def stats():
+    with _ops_lock:
+        ops = dict(_ops)
+    return {
+        operation: {
+            "calls": s.calls,
+            "errors": s.errors,
+            "error_rate": round(s.errors / s.calls, 4) if s.calls else 0.0,
+            "latency_ms": s.latency.snapshot(),
+        }
+        for operation, s in sorted(ops.items())
+    }
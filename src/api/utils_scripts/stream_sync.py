@@ -0,0 +1,214 @@
+"""
+Cola de sincronización de usuarios con Stream Chat.
+
+Las rutas (login, stream-token, sync-my-avatar, update_user) solo encolan: una fila
+en stream_sync_job por usuario, así que varias peticiones seguidas del mismo usuario
+se convierten en un único upsert. El trabajo lo hace:
+- un hilo dentro de cada proceso web (por defecto), que se despierta al encolar, o
+- un proceso aparte: "flask stream-sync-worker" con STREAM_SYNC_WORKER=external.
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+from sqlalchemy.exc import SQLAlchemyError
+from api.models import db, User, StreamSyncJob, StreamUserSync
+from api.utils_scripts.db_utils import dialect_insert
+from api.utils_scripts.stream_client import get_stream_client
+
+BATCH_SIZE = 100
+LEASE_SECONDS = 60
+MAX_BACKOFF_SECONDS = 600
+
+_wake = threading.Event()
+_worker_started = False
+_worker_lock = threading.Lock()
+_counters = {"enqueued": 0, "synced": 0, "failed_batches": 0}
+_counters_lock = threading.Lock()
+
+
+def _count(name, n=1):
+    # Se llama desde las peticiones y desde el hilo del worker
+    with _counters_lock:
+        _counters[name] += n
+
+
+def stream_user_payload(user):
+    return {
+        "id": str(user.id),
+        "name": user.username,
+        "email": user.email or "",
+        "image": user.image_avatar or User.DEFAULT_AVATAR_URL,
+    }
+
+
+def record_synced(payloads):
+    """Guarda lo que se acaba de enviar a Stream (un único INSERT ... ON CONFLICT)."""
+    if not payloads:
+        return
+    now = datetime.utcnow()
+    stmt = dialect_insert(StreamUserSync.__table__).values([
+        {"user_id": int(p["id"]), "name": p["name"], "image": p["image"], "synced_at": now}
+        for p in payloads
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id"],
+        set_={"name": stmt.excluded.name, "image": stmt.excluded.image, "synced_at": stmt.excluded.synced_at},
+    )
+    db.session.execute(stmt)
+    db.session.commit()
+
+
+def sync_users_if_changed(client, users, reported_images=None):
+    """
+    Un solo upsert_users con los usuarios cuyo nombre/avatar no coincide con lo último
+    sincronizado, o cuya imagen en Stream (reported_images: {user_id: image}) es distinta
+    de la de la BD. Si nada cambió no se escribe nada en Stream. Devuelve los payloads enviados.
+    """
+    if not users:
+        return []
+    reported_images = reported_images or {}
+    records = {
+        r.user_id: r
+        for r in StreamUserSync.query.filter(StreamUserSync.user_id.in_([u.id for u in users])).all()
+    }
+    changed = []
+    for user in users:
+        payload = stream_user_payload(user)
+        record = records.get(user.id)
+        in_sync = record is not None and record.name == payload["name"] and record.image == payload["image"]
+        reported = reported_images.get(user.id)
+        if in_sync and (reported is None or reported == payload["image"]):
+            continue
+        changed.append(payload)
+    if changed:
+        client.upsert_users(changed)
+        try:
+            record_synced(changed)
+        except SQLAlchemyError:
+            db.session.rollback()
+    return changed
+
+
+def enqueue_user_sync(user_id, restore=False):
+    """Encola (o actualiza) la sincronización del usuario. No llama a Stream."""
+    now = datetime.utcnow()
+    stmt = dialect_insert(StreamSyncJob.__table__).values(
+        user_id=int(user_id), restore=restore, attempts=0, run_after=now, updated_at=now,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id"],
+        set_={
+            "restore": or_(StreamSyncJob.__table__.c.restore, stmt.excluded.restore),
+            "run_after": now,
+            "updated_at": now,
+        },
+    )
+    try:
+        db.session.execute(stmt)
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        print(f"Error enqueuing Stream sync for user {user_id}: {e}")
+        return
+    _count("enqueued")
+    _ensure_inline_worker()
+    _wake.set()
+
+
+def process_pending(limit=BATCH_SIZE):
+    """
+    Procesa un lote de trabajos vencidos: un restore_users y un upsert_users para todo el lote.
+    Devuelve cuántos trabajos se procesaron. Necesita app context.
+    """
+    now = datetime.utcnow()
+    jobs = (
+        StreamSyncJob.query
+        .filter(StreamSyncJob.run_after <= now)
+        .order_by(StreamSyncJob.run_after)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    if not jobs:
+        db.session.rollback()
+        return 0
+
+    # Reclamar el lote (lease) y soltar los bloqueos antes de llamar a Stream, para que
+    # encolar desde /login nunca espere a una llamada remota.
+    snapshot = {job.user_id: job.updated_at for job in jobs}
+    restore_ids = [str(job.user_id) for job in jobs if job.restore]
+    attempts = {job.user_id: job.attempts for job in jobs}
+    for job in jobs:
+        job.run_after = now + timedelta(seconds=LEASE_SECONDS)
+    db.session.commit()
+
+    users = User.query.filter(User.id.in_(list(snapshot))).all()
+    try:
+        client = get_stream_client()
+        if restore_ids:
+            try:
+                client.restore_users(restore_ids)
+            except Exception:
+                pass  # lo normal es que no estuvieran borrados
+        if users:
+            payloads = [stream_user_payload(u) for u in users]
+            client.upsert_users(payloads)
+            record_synced(payloads)
+    except Exception as e:
+        # Si el fallo vino de la BD la transacción está abortada: limpiarla antes de reprogramar
+        db.session.rollback()
+        _count("failed_batches")
+        for user_id, updated_at in snapshot.items():
+            tries = attempts[user_id] + 1
+            StreamSyncJob.query.filter_by(user_id=user_id, updated_at=updated_at).update({
+                "attempts": tries,
+                "last_error": str(e)[:1000],
+                "run_after": now + timedelta(seconds=min(MAX_BACKOFF_SECONDS, 5 * 2 ** tries)),
+            })
+        db.session.commit()
+        return len(snapshot)
+
+    # Borrar solo si nadie volvió a encolar mientras tanto (si no, se repite con los datos nuevos)
+    for user_id, updated_at in snapshot.items():
+        StreamSyncJob.query.filter_by(user_id=user_id, updated_at=updated_at).delete()
+    db.session.commit()
+    _count("synced", len(users))
+    return len(snapshot)
+
+
+def run_worker(app, poll_interval=5.0, stop=None):
+    """Bucle del worker: procesa lotes hasta vaciar la cola y espera a que se encole algo."""
+    while stop is None or not stop.is_set():
+        try:
+            with app.app_context():
+                processed = process_pending()
+        except Exception as e:
+            print(f"Stream sync worker error: {e}")
+            processed = 0
+        if not processed:
+            _wake.wait(poll_interval)
+            _wake.clear()
+
+
+def _ensure_inline_worker():
+    global _worker_started
+    if _worker_started or os.getenv("STREAM_SYNC_WORKER", "inline") != "inline":
+        return
+    from flask import current_app
+    app = current_app._get_current_object()
+    with _worker_lock:
+        if not _worker_started:
+            threading.Thread(target=run_worker, args=(app,), name="stream-sync", daemon=True).start()
+            _worker_started = True
+
+
+def stats():
+    try:
+        pending = StreamSyncJob.query.count()
+    except SQLAlchemyError:
+        db.session.rollback()
+        pending = None
+    with _counters_lock:
+        counters = dict(_counters)
+    return {**counters, "pending": pending, "mode": os.getenv("STREAM_SYNC_WORKER", "inline")}
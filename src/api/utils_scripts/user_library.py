@@ -0,0 +1,83 @@
+"""
+Pertenencia de libros a la librería de un usuario (tabla user_library).
+
+Cada operación es una sola sentencia sobre la clave primaria (user_id, book_isbn),
+así que cuesta lo mismo con 10 libros que con 10.000: no se carga user.library_books.
+No hacen commit.
+
+library_page() lista la librería por páginas (cursor keyset) ordenada por fecha de
+alta, título o autor, con filtro opcional por texto en título/autor. El orden por
+fecha sale directamente del índice ix_user_library_user_added; por título o autor
+solo se ordenan los libros de ese usuario (rango de la clave primaria de user_library).
+"""
+from datetime import datetime
+from sqlalchemy import and_, or_, func
+from api.models import db, user_library, Book
+from api.utils_scripts.db_utils import dialect_insert, escape_like
+from api.utils_scripts.pagination import encode_cursor, keyset_after, order_by_keys
+
+# sort -> (expresión de orden, descendente por defecto); el isbn desempata
+LIBRARY_SORTS = {
+    "added": (user_library.c.added_at, True),
+    "title": (func.lower(Book.title), False),
+    "author": (func.lower(func.coalesce(Book.author, "")), False),
+}
+
+
+def _row(user_id, isbn):
+    return and_(user_library.c.user_id == user_id, user_library.c.book_isbn == isbn)
+
+
+def add_to_library(user_id, isbn):
+    """INSERT ... ON CONFLICT DO NOTHING. True si se añadió, False si ya estaba."""
+    # El libro puede estar pendiente en la sesión: la sentencia Core no hace autoflush
+    db.session.flush()
+    stmt = dialect_insert(user_library).values(user_id=user_id, book_isbn=isbn)
+    stmt = stmt.on_conflict_do_nothing(index_elements=["user_id", "book_isbn"])
+    return db.session.execute(stmt).rowcount == 1
+
+
+def remove_from_library(user_id, isbn):
+    """DELETE de la fila. True si el libro estaba en la librería."""
+    return db.session.execute(user_library.delete().where(_row(user_id, isbn))).rowcount > 0
+
+
+def library_page(user_id, sort="added", descending=None, q=None, limit=None, after=None):
+    """
+    (filas, next_cursor) con filas = [(Book, added_at)]. limit=None devuelve todo.
+    after: valores de un cursor anterior (lista). Lanza ValueError si sort o el cursor no valen.
+    """
+    if sort not in LIBRARY_SORTS:
+        raise ValueError(f"Invalid sort: {sort}")
+    expression, default_descending = LIBRARY_SORTS[sort]
+    if descending is None:
+        descending = default_descending
+    keys = [(expression, descending), (user_library.c.book_isbn, descending)]
+
+    query = (
+        db.session.query(Book, user_library.c.added_at, expression)
+        .join(user_library, user_library.c.book_isbn == Book.isbn)
+        .filter(user_library.c.user_id == user_id)
+    )
+    if q:
+        pattern = f"%{escape_like(q.lower())}%"
+        query = query.filter(or_(
+            func.lower(Book.title).like(pattern, escape="\\"),
+            func.lower(Book.author).like(pattern, escape="\\"),
+        ))
+    if after:
+        if len(after) != len(keys):
+            raise ValueError("Invalid cursor")
+        if sort == "added":
+            after = [datetime.fromisoformat(after[0]), after[1]]
+        query = query.filter(keyset_after(keys, after))
+    query = query.order_by(*order_by_keys(keys))
+
+    if limit is None:
+        return [(book, added_at) for book, added_at, _ in query.all()], None
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        book, added_at, value = rows[limit - 1]
+        next_cursor = encode_cursor([value.isoformat() if sort == "added" else value, book.isbn])
+    return [(book, added_at) for book, added_at, _ in rows[:limit]], next_cursor
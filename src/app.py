@@ -13,6 +13,7 @@ from api.models import db
 from api.routes import api
 from api.admin import setup_admin
 from api.commands import setup_commands
+from api.utils_scripts import password_hashing
 
 
 load_dotenv()
@@ -31,7 +32,8 @@ CORS(
         "http://127.0.0.1:5173",
         "http://localhost:5173",
     ]}},
-    supports_credentials=True
+    supports_credentials=True,
+    expose_headers=["X-Next-Cursor", "ETag", "X-Prompt-Tokens", "X-Cache"],
 )
 
 app.config["SECRET_KEY"] = os.getenv("FLASK_SECRET_KEY", "dev-secret-key")
@@ -54,6 +56,9 @@ else:
 db.init_app(app)
 MIGRATE = Migrate(app, db)
 
+# Falla al arrancar (y no en el primer login) si PASSWORD_HASH_METHOD no se puede usar
+password_hashing.get_hasher()
+
 
 setup_admin(app)
 
@@ -0,0 +1,39 @@
+# Configuración de gunicorn. Se carga sola porque Procfile/render.yaml arrancan con
+# "gunicorn wsgi --chdir ./src/" y gunicorn busca gunicorn.conf.py en ese directorio.
+#
+# GUNICORN_WORKER_CLASS elige el modo de servir:
+# - "sync" (por defecto): un proceso atiende una petición cada vez.
+# - "gthread": varios hilos por worker (GUNICORN_THREADS).
+# - "gevent": modo asíncrono. Cada worker es un bucle de eventos y las llamadas de red
+#   (Google Books, Stream Chat, Gemini, PostgreSQL) ceden el control mientras esperan,
+#   así un worker mantiene miles de llamadas en vuelo. Las rutas síncronas (librería,
+#   eventos...) funcionan sin cambios.
+import os
+
+# Procesos worker. Los límites en memoria (streams de /ai-chat, caches...) son por worker;
+# ai_streams reparte AI_CHAT_MAX_STREAMS_TOTAL entre este número de workers.
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+threads = int(os.getenv("GUNICORN_THREADS", "1"))
+# Máximo de clientes simultáneos por worker en modo gevent
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+# Las respuestas en streaming de /ai-chat pueden durar bastante
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+
+def post_fork(server, worker):
+    if worker_class != "gevent":
+        return
+    # psycopg2 y grpc (google-generativeai) no ceden el control con el monkey patch
+    # de gevent por sí solos; sin esto una consulta lenta bloquearía todo el worker.
+    try:
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    except ImportError:
+        server.log.warning("psycogreen not installed: PostgreSQL queries will block the gevent loop")
+    try:
+        from grpc.experimental import gevent as grpc_gevent
+        grpc_gevent.init_gevent()
+    except ImportError:
+        pass